@@ -1,12 +1,39 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
 
-from .models import Student
+from .models import Student, StudentProfileDetail
+from .utils.student_columns import ADMIN_LIST_FIELDS
+
+
+class StudentChangeList(ChangeList):
+    def get_queryset(self, request, exclude_parameters=None):
+        # the changelist loads the list_display columns only; the change form still loads the whole row
+        return super().get_queryset(request, exclude_parameters).only(*ADMIN_LIST_FIELDS)
+
+
+class StudentProfileDetailInline(admin.StackedInline):
+    model = StudentProfileDetail
+    can_delete = False
+    fieldsets = (
+        ('Health Information', {
+            'fields': ('disease_history', 'disease_status')
+        }),
+        ('Interests and Talents', {
+            'fields': ('sport_interest', 'sport_achievement', 'art_interest', 'art_achievement', 'literacy_interest',
+                       'literacy_achievement', 'science_interest', 'science_achievement', 'mtq_interest',
+                       'mtq_achievement', 'media_interest', 'media_achievement')
+        }),
+        ('Organizational History', {
+            'fields': ('organization_history',)
+        }),
+    )
 
 
 class StudentAdmin(admin.ModelAdmin):
     list_display = ('full_name', 'email', 'level', 'faculty', 'major')
     search_fields = ('user__first_name', 'user__last_name', 'user__email', 'passport_number', 'nik')
     list_filter = ('level', 'faculty', 'gender', 'region_origin')
+    list_select_related = ('user',)
     fieldsets = (
         ('Personal Info', {
             'fields': ('user', 'whatsapp_number', 'gender', 'birth_place', 'birth_date', 'marital_status',
@@ -25,20 +52,14 @@ class StudentAdmin(admin.ModelAdmin):
         ('Guardian Information', {
             'fields': ('photo_url', 'guardian_name', 'guardian_phone')
         }),
-        ('Health Information', {
-            'fields': ('disease_history', 'disease_status')
-        }),
-        ('Interests and Talents', {
-            'fields': ('sport_interest', 'sport_achievement', 'art_interest', 'art_achievement', 'literacy_interest',
-                       'literacy_achievement', 'science_interest', 'science_achievement', 'mtq_interest',
-                       'mtq_achievement', 'media_interest', 'media_achievement')
-        }),
-        ('Organizational History', {
-            'fields': ('organization_history',)
-        }),
     )
+    # health, interests and organizations are stored in their own table
+    inlines = [StudentProfileDetailInline]
     readonly_fields = ('id',)
 
+    def get_changelist(self, request, **kwargs):
+        return StudentChangeList
+
 
 # Register your models here.
 admin.site.register(Student, StudentAdmin)
@@ -1,7 +1,7 @@
 from django import forms
 from django.contrib.auth import get_user_model
 
-from .models import Student
+from .models import PROFILE_DETAIL_FIELDS, Student, StudentProfileDetail
 
 User = get_user_model()
 
@@ -80,7 +80,30 @@ class StaffLoginForm(forms.Form):
         return cleaned_data
 
 
-class StudentForm(forms.ModelForm):
+class ProfileDetailFieldsMixin:
+    """Adds the StudentProfileDetail fields to a Student model form.
+
+    They are built from the detail model with the form's ``Meta.widgets``
+    and written to the student's attributes on validation, so ``save()``
+    stores them with the student (see ``Student.detail``).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        detail_fields = forms.fields_for_model(StudentProfileDetail, fields=PROFILE_DETAIL_FIELDS,
+                                               widgets=self._meta.widgets)
+        for name, field in detail_fields.items():
+            self.fields[name] = field
+            self.initial.setdefault(name, getattr(self.instance, name))
+
+    def _post_clean(self):
+        super()._post_clean()
+        for name in PROFILE_DETAIL_FIELDS:
+            if name in self.cleaned_data:
+                setattr(self.instance, name, self.cleaned_data[name])
+
+
+class StudentForm(ProfileDetailFieldsMixin, forms.ModelForm):
     class Meta:
         model = Student
         exclude = ['user']  # Remove the temporary exclusion of financial fields
@@ -207,7 +230,7 @@ class StudentForm(forms.ModelForm):
         return cleaned_data
 
 
-class StaffStudentForm(forms.ModelForm):
+class StaffStudentForm(ProfileDetailFieldsMixin, forms.ModelForm):
     # User fields that are not part of Student model
     email = forms.EmailField(
         required=False,
@@ -236,12 +259,8 @@ class StaffStudentForm(forms.ModelForm):
             'marital_status', 'citizenship_status', 'region_origin', 'parents_name', 'parents_phone',
             'institution', 'faculty', 'major', 'degree_level', 'semester_level', 'latest_grade',
             'passport_number', 'nik', 'lapdik_number', 'arrival_date', 'school_origin',
-            'home_name', 'home_location', 'level',
-            'disease_history', 'disease_status',
-            'sport_interest', 'sport_achievement', 'art_interest', 'art_achievement',
-            'literacy_interest', 'literacy_achievement', 'science_interest', 'science_achievement',
-            'mtq_interest', 'mtq_achievement', 'media_interest', 'media_achievement',
-            'organization_history', 'is_draft',
+            'home_name', 'home_location', 'level', 'is_draft',
+            # the health, interest and organization fields come from ProfileDetailFieldsMixin
             # Financial fields
             'education_funding', 'scholarship_source', 'living_cost', 'monthly_income'
         ]
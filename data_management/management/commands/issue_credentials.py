@@ -0,0 +1,144 @@
+import csv
+import multiprocessing
+import secrets
+import smtplib
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+
+from data_management.utils import import_worker
+from data_management.utils.command_lock import exclusive_command
+from data_management.utils.student_import import chunked
+
+
+class Command(BaseCommand):
+    help = ('Generate initial passwords for imported students that have none yet. '
+            'Hashing runs in a process pool; credentials are emailed and/or written to a CSV file.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', action='store_true', help='Email each student their credentials')
+        parser.add_argument('--output', help='Write username,email,password rows to this CSV file')
+        parser.add_argument('--username', action='append', dest='usernames',
+                            help='Only issue credentials for this user (repeatable)')
+        parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(),
+                            help='Processes used for password hashing (default: CPU count)')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Users hashed, emailed and saved per batch (default: 500)')
+        parser.add_argument('--login-url', default='', help='Login URL included in the email')
+
+    @exclusive_command()
+    def handle(self, *args, **options):
+        if not options['email'] and not options['output']:
+            raise CommandError('Passwords would be lost: pass --email and/or --output.')
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        User = get_user_model()
+        # Unusable passwords start with "!" (see django.contrib.auth.hashers.UNUSABLE_PASSWORD_PREFIX)
+        users = User.objects.filter(password__startswith='!', student_profile__isnull=False, is_active=True)
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+        if not options['output']:
+            # without an output file, users we cannot email would never see their password
+            users = users.exclude(Q(email='') | Q(email__isnull=True))
+        # collect ids first: the rows are rewritten while we go, so don't hold a cursor over them
+        user_ids = list(users.order_by('pk').values_list('pk', flat=True))
+        users = User.objects.only('id', 'username', 'email', 'first_name', 'last_name').order_by('pk')
+
+        output_file = writer = None
+        if options['output']:
+            output_file = open(options['output'], 'w', newline='', encoding='utf-8')
+            writer = csv.writer(output_file)
+            writer.writerow(['username', 'email', 'password'])
+
+        issued = emailed = 0
+        failed = []
+        executor = None
+        if options['workers'] > 1:
+            executor = ProcessPoolExecutor(max_workers=options['workers'],
+                                           mp_context=multiprocessing.get_context('spawn'),
+                                           initializer=import_worker.init_worker,
+                                           initargs=(import_worker.worker_settings(),))
+        try:
+            for ids in chunked(user_ids, options['batch_size']):
+                self.lease.check()
+                batch = list(users.filter(pk__in=ids))
+                passwords = [secrets.token_urlsafe(10) for _ in batch]
+                if executor is not None:
+                    hashes = list(executor.map(import_worker.hash_password, passwords,
+                                               chunksize=max(1, len(passwords) // options['workers'])))
+                else:
+                    hashes = [import_worker.hash_password(password) for password in passwords]
+
+                if writer is not None:
+                    writer.writerows([user.username, user.email, password] for user, password in zip(batch, passwords))
+                    output_file.flush()
+                sent = set()
+                if options['email']:
+                    sent = self.send_credentials(batch, passwords, options['login_url'])
+                    emailed += len(sent)
+                    failed += [user for user in batch if user.email and user.pk not in sent]
+                # a password is only set once it reached someone (the file or the email); the others
+                # keep their unusable password, so the next run issues theirs again
+                delivered = []
+                for user, password_hash in zip(batch, hashes):
+                    if writer is not None or user.pk in sent:
+                        user.password = password_hash
+                        delivered.append(user)
+                with transaction.atomic():
+                    User.objects.bulk_update(delivered, ['password'])
+                issued += len(delivered)
+                self.stdout.write(f'Issued {issued} passwords...')
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            if output_file is not None:
+                output_file.close()
+
+        self.stdout.write(self.style.SUCCESS(f'Passwords issued: {issued}, emails sent: {emailed}'))
+        if options['output']:
+            self.stdout.write(self.style.WARNING(
+                f"Credentials written to {options['output']}; delete the file once they are handed out."))
+        if failed:
+            names = ', '.join(user.username for user in failed)
+            raise CommandError(f'Could not email {len(failed)} users: {names}. ' + (
+                f"Their passwords are in {options['output']}." if options['output'] else
+                'Their passwords were not set; run the command again to retry.'))
+
+    def send_credentials(self, users, passwords, login_url):
+        """Send one email per user over a single connection; returns the pks of the users it was sent to."""
+        sent = set()
+        connection = get_connection()
+        try:
+            connection.open()
+            for user, password in zip(users, passwords):
+                if not user.email:
+                    continue
+                full_name = f'{user.first_name} {user.last_name}'.strip() or user.username
+                body = (
+                    f"Halo {full_name},\n\n"
+                    f"Akun Anda telah dibuat di sistem KMM Mesir.\n\n"
+                    f"Username: {user.username}\nPassword: {password}\n\n"
+                    + (f"Silakan login di: {login_url}\n" if login_url else "")
+                    + "Segera ganti password setelah login.\n\nTerima kasih."
+                )
+                message = EmailMessage(subject='Akun KMM Mesir Anda', body=body,
+                                       from_email=settings.DEFAULT_FROM_EMAIL, to=[user.email], connection=connection)
+                try:
+                    message.send()
+                except (smtplib.SMTPException, OSError) as e:
+                    self.stderr.write(f'Could not email {user.username} <{user.email}>: {e}')
+                else:
+                    sent.add(user.pk)
+        except (smtplib.SMTPException, OSError) as e:
+            self.stderr.write(f'Could not connect to the mail server: {e}')
+        finally:
+            connection.close()
+        return sent
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from data_management.models import CommandLock
+
+
+def format_age(delta):
+    seconds = int(delta.total_seconds())
+    hours, seconds = divmod(abs(seconds), 3600)
+    minutes, seconds = divmod(seconds, 60)
+    return f'{hours}h{minutes:02d}m{seconds:02d}s' if hours else f'{minutes}m{seconds:02d}s'
+
+
+class Command(BaseCommand):
+    help = 'Show which management commands hold a single-runner lock, and for how long.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--release', metavar='NAME',
+                            help='Forcibly remove lock NAME (only if its holder is known to be gone)')
+
+    def handle(self, *args, **options):
+        if options['release']:
+            deleted, _ = CommandLock.objects.filter(name=options['release']).delete()
+            if not deleted:
+                raise CommandError(f"No lock named {options['release']!r}")
+            self.stdout.write(self.style.WARNING(f"Released lock {options['release']!r}"))
+            return
+
+        now = timezone.now()
+        locks = CommandLock.objects.order_by('name')
+        if not locks:
+            self.stdout.write('No locks held.')
+            return
+        for lock in locks:
+            line = (f'{lock.name}: {lock.command} on {lock.host} (pid {lock.pid}), '
+                    f'held for {format_age(now - lock.acquired_at)}, '
+                    f'renewed {format_age(now - lock.renewed_at)} ago')
+            if lock.expires_at < now:
+                self.stdout.write(self.style.ERROR(
+                    f'{line}, STALE (expired {format_age(now - lock.expires_at)} ago; the next command takes it over)'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{line}, expires in {format_age(lock.expires_at - now)}'))
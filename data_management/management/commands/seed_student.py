@@ -3,6 +3,7 @@ from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
 from faker import Faker
 from data_management.models import Student
+from data_management.utils.command_lock import exclusive_command
 
 import secrets
 import string
@@ -19,6 +20,7 @@ def generate_living_cost(minimum=1500000, maximum=5000000):
 class Command(BaseCommand):
     help = 'Seed 100 student records linked to users, create or update as needed with Faker data (username & email faker)'
 
+    @exclusive_command()
     def handle(self, *args, **kwargs):
         fake = Faker('id_ID')
         fake.unique.clear()
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_management', '0019_alter_student_degree_level_alter_student_home_name_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='import_hash',
+            field=models.CharField(blank=True, editable=False, max_length=32),
+        ),
+    ]
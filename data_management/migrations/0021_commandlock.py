@@ -0,0 +1,26 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_management', '0020_student_import_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommandLock',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('token', models.CharField(max_length=32)),
+                ('command', models.CharField(max_length=100)),
+                ('host', models.CharField(max_length=255)),
+                ('pid', models.PositiveIntegerField()),
+                ('acquired_at', models.DateTimeField()),
+                ('renewed_at', models.DateTimeField()),
+                ('expires_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,109 @@
+# Full-text search document for the staff student list; see utils/student_search.py.
+#
+# The document is owned by the database: triggers rebuild it whenever a student
+# or the name/email of its user changes, so the ORM saves, bulk_create/bulk_update
+# and the COPY import all keep it current without extra code.
+
+from django.db import migrations
+
+PG_FORWARD = [
+    'ALTER TABLE data_management_student ADD COLUMN search_document tsvector',
+    """CREATE FUNCTION data_management_student_search_document() RETURNS trigger AS $$
+    BEGIN
+        SELECT setweight(to_tsvector('simple', concat_ws(' ', u.first_name, u.last_name)), 'A')
+            || setweight(to_tsvector('simple', concat_ws(' ', u.email, replace(u.email, '@', ' '))), 'B')
+          INTO NEW.search_document
+          FROM auth_user u WHERE u.id = NEW.user_id;
+        NEW.search_document := coalesce(NEW.search_document, ''::tsvector)
+            || setweight(to_tsvector('simple', concat_ws(' ', NEW.passport_number, NEW.nik)), 'A')
+            || setweight(to_tsvector('simple', concat_ws(' ', NEW.faculty, NEW.major)), 'C');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql""",
+    """CREATE TRIGGER data_management_student_search
+        BEFORE INSERT OR UPDATE OF user_id, passport_number, nik, faculty, major ON data_management_student
+        FOR EACH ROW EXECUTE FUNCTION data_management_student_search_document()""",
+    """CREATE FUNCTION data_management_user_search_document() RETURNS trigger AS $$
+    BEGIN
+        -- touching user_id re-runs the student trigger
+        UPDATE data_management_student SET user_id = user_id WHERE user_id = NEW.id;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql""",
+    """CREATE TRIGGER data_management_user_search
+        AFTER UPDATE OF first_name, last_name, email ON auth_user
+        FOR EACH ROW
+        WHEN (OLD.first_name IS DISTINCT FROM NEW.first_name OR OLD.last_name IS DISTINCT FROM NEW.last_name
+              OR OLD.email IS DISTINCT FROM NEW.email)
+        EXECUTE FUNCTION data_management_user_search_document()""",
+    'UPDATE data_management_student SET user_id = user_id',
+    'CREATE INDEX data_management_student_search_gin ON data_management_student USING gin (search_document)',
+]
+
+PG_BACKWARD = [
+    'DROP TRIGGER IF EXISTS data_management_user_search ON auth_user',
+    'DROP FUNCTION IF EXISTS data_management_user_search_document()',
+    'DROP TRIGGER IF EXISTS data_management_student_search ON data_management_student',
+    'DROP FUNCTION IF EXISTS data_management_student_search_document()',
+    'ALTER TABLE data_management_student DROP COLUMN IF EXISTS search_document',
+]
+
+# student ids are UUIDs, so they live in an unindexed column rather than in the rowid
+SQLITE_DOCUMENT = """
+    SELECT s.id, trim(u.first_name || ' ' || u.last_name), u.email,
+           trim(coalesce(s.passport_number, '') || ' ' || coalesce(s.nik, '')),
+           trim(coalesce(s.faculty, '') || ' ' || coalesce(s.major, ''))
+      FROM data_management_student s JOIN auth_user u ON u.id = s.user_id
+"""
+
+SQLITE_FORWARD = [
+    """CREATE VIRTUAL TABLE data_management_student_search USING fts5(student_id UNINDEXED, name, email, identity, study)""",
+    f"""CREATE TRIGGER data_management_student_search_insert AFTER INSERT ON data_management_student BEGIN
+        INSERT INTO data_management_student_search (student_id, name, email, identity, study)
+        {SQLITE_DOCUMENT} WHERE s.id = NEW.id;
+    END""",
+    f"""CREATE TRIGGER data_management_student_search_update AFTER UPDATE ON data_management_student BEGIN
+        DELETE FROM data_management_student_search WHERE student_id = OLD.id;
+        INSERT INTO data_management_student_search (student_id, name, email, identity, study)
+        {SQLITE_DOCUMENT} WHERE s.id = NEW.id;
+    END""",
+    """CREATE TRIGGER data_management_student_search_delete AFTER DELETE ON data_management_student BEGIN
+        DELETE FROM data_management_student_search WHERE student_id = OLD.id;
+    END""",
+    f"""CREATE TRIGGER data_management_user_search_update
+        AFTER UPDATE OF first_name, last_name, email ON auth_user BEGIN
+        DELETE FROM data_management_student_search
+         WHERE student_id IN (SELECT id FROM data_management_student WHERE user_id = NEW.id);
+        INSERT INTO data_management_student_search (student_id, name, email, identity, study)
+        {SQLITE_DOCUMENT} WHERE s.user_id = NEW.id;
+    END""",
+    f"""INSERT INTO data_management_student_search (student_id, name, email, identity, study) {SQLITE_DOCUMENT}""",
+]
+
+SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS data_management_user_search_update',
+    'DROP TRIGGER IF EXISTS data_management_student_search_delete',
+    'DROP TRIGGER IF EXISTS data_management_student_search_update',
+    'DROP TRIGGER IF EXISTS data_management_student_search_insert',
+    'DROP TABLE IF EXISTS data_management_student_search',
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement, params=None)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_management', '0023_dataversion'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunPython(run({'postgresql': PG_FORWARD, 'sqlite': SQLITE_FORWARD}),
+                             run({'postgresql': PG_BACKWARD, 'sqlite': SQLITE_BACKWARD})),
+    ]
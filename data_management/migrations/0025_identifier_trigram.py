@@ -0,0 +1,47 @@
+# Trigram indexes for partial / typo-tolerant identifier lookups (``match=id`` in the staff
+# list); see utils/student_search.py.
+#
+# pg_trgm ships with PostgreSQL's contrib package. Where it cannot be installed the
+# indexes are skipped and the lookup falls back to sequential ILIKE matching.
+
+import logging
+
+from django.db import migrations
+
+logger = logging.getLogger(__name__)
+
+IDENTIFIER_COLUMNS = ['passport_number', 'nik', 'lapdik_number', 'whatsapp_number']
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        available = cursor.fetchone() is not None
+    if not available:
+        logger.warning('pg_trgm is not available on this server; identifier lookups will not be indexed')
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm', params=None)
+    for column in IDENTIFIER_COLUMNS:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS data_management_student_{column}_trgm '
+            f'ON data_management_student USING gin ({column} gin_trgm_ops)', params=None)
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for column in IDENTIFIER_COLUMNS:
+        schema_editor.execute(f'DROP INDEX IF EXISTS data_management_student_{column}_trgm', params=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_management', '0024_student_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
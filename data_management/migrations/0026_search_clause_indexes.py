@@ -0,0 +1,42 @@
+# Indexes behind the email:, passport: and faculty: search clauses (utils/student_query.py).
+#
+# Django's iexact/istartswith compare UPPER(column::text), so the indexes are on that
+# expression; text_pattern_ops makes them usable for LIKE 'prefix%' outside the C locale.
+# nik: and degree: use the indexes Django already creates for those fields.
+# SQLite compares case-insensitively without them.
+
+from django.db import migrations
+
+PG_FORWARD = [
+    'CREATE INDEX IF NOT EXISTS data_management_user_email_upper '
+    'ON auth_user (UPPER(email::text) text_pattern_ops)',
+    'CREATE INDEX IF NOT EXISTS data_management_student_passport_upper '
+    'ON data_management_student (UPPER(passport_number::text) text_pattern_ops)',
+    'CREATE INDEX IF NOT EXISTS data_management_student_faculty_upper '
+    'ON data_management_student (UPPER(faculty::text) text_pattern_ops)',
+]
+
+PG_BACKWARD = [
+    'DROP INDEX IF EXISTS data_management_user_email_upper',
+    'DROP INDEX IF EXISTS data_management_student_passport_upper',
+    'DROP INDEX IF EXISTS data_management_student_faculty_upper',
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor == 'postgresql':
+            for statement in statements:
+                schema_editor.execute(statement, params=None)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_management', '0025_identifier_trigram'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(PG_FORWARD), run(PG_BACKWARD)),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_management', '0026_search_clause_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataversion',
+            name='row_count',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,145 @@
+# Generated by Django 5.2.4 on 2026-10-17 04:07
+#
+# Lower-cased name and email on the student row (Student.full_name_key / email_key) so the
+# staff list sorts and filters on indexed student columns instead of joining auth_user.
+#
+# Like the search document (0024_student_search), the keys are owned by the database: triggers
+# set them on insert, when user_id is written and when the user's name or email changes, so
+# the ORM, bulk and COPY import paths need no code of their own. On PostgreSQL the user-side
+# trigger of 0024 already touches user_id for those changes. Adding the columns makes Django
+# rebuild the student table on SQLite, which fails while a trigger on auth_user refers to the
+# table and drops the table's own triggers, so the search triggers are dropped before and
+# recreated after.
+
+from importlib import import_module
+
+from django.conf import settings
+from django.db import migrations, models
+
+search = import_module('data_management.migrations.0024_student_search')
+
+# the search triggers of 0024, without its table and backfill
+SEARCH_TRIGGERS = [statement for statement in search.SQLITE_FORWARD if statement.startswith('CREATE TRIGGER')]
+SEARCH_DROP_TRIGGERS = [statement for statement in search.SQLITE_BACKWARD if statement.startswith('DROP TRIGGER')]
+
+PG_FORWARD = [
+    """CREATE FUNCTION data_management_student_sort_keys() RETURNS trigger AS $$
+    BEGIN
+        SELECT lower(trim(concat_ws(' ', u.first_name, u.last_name))), lower(u.email)
+          INTO NEW.full_name_key, NEW.email_key
+          FROM auth_user u WHERE u.id = NEW.user_id;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql""",
+    """CREATE TRIGGER data_management_student_sort_keys
+        BEFORE INSERT OR UPDATE OF user_id ON data_management_student
+        FOR EACH ROW EXECUTE FUNCTION data_management_student_sort_keys()""",
+    'UPDATE data_management_student SET user_id = user_id',
+]
+
+PG_BACKWARD = [
+    'DROP TRIGGER IF EXISTS data_management_student_sort_keys ON data_management_student',
+    'DROP FUNCTION IF EXISTS data_management_student_sort_keys()',
+]
+
+SQLITE_KEYS = """
+    UPDATE data_management_student
+       SET full_name_key = (SELECT lower(trim(u.first_name || ' ' || u.last_name)) FROM auth_user u
+                             WHERE u.id = data_management_student.user_id),
+           email_key = (SELECT lower(u.email) FROM auth_user u WHERE u.id = data_management_student.user_id)
+"""
+
+SQLITE_TRIGGERS = [
+    f"""CREATE TRIGGER data_management_student_sort_keys_insert AFTER INSERT ON data_management_student BEGIN
+        {SQLITE_KEYS} WHERE id = NEW.id;
+    END""",
+    f"""CREATE TRIGGER data_management_student_sort_keys_update
+        AFTER UPDATE OF user_id ON data_management_student BEGIN
+        {SQLITE_KEYS} WHERE id = NEW.id;
+    END""",
+    f"""CREATE TRIGGER data_management_user_sort_keys_update
+        AFTER UPDATE OF first_name, last_name, email ON auth_user BEGIN
+        {SQLITE_KEYS} WHERE user_id = NEW.id;
+    END""",
+]
+
+SQLITE_DROP_TRIGGERS = [
+    'DROP TRIGGER IF EXISTS data_management_user_sort_keys_update',
+    'DROP TRIGGER IF EXISTS data_management_student_sort_keys_update',
+    'DROP TRIGGER IF EXISTS data_management_student_sort_keys_insert',
+]
+
+SQLITE_FORWARD = [
+    *SEARCH_TRIGGERS,
+    *SQLITE_TRIGGERS,
+    SQLITE_KEYS,
+]
+
+SQLITE_BACKWARD = [
+    # removing the columns rebuilds the table again
+    *SQLITE_DROP_TRIGGERS,
+    *SEARCH_DROP_TRIGGERS,
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement, params=None)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_management', '0027_dataversion_row_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(run({'sqlite': SEARCH_DROP_TRIGGERS}), run({'sqlite': SEARCH_TRIGGERS})),
+        migrations.AddField(
+            model_name='student',
+            name='email_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=254),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='full_name_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=301),
+        ),
+        migrations.RunPython(run({'postgresql': PG_FORWARD, 'sqlite': SQLITE_FORWARD}),
+                             run({'postgresql': PG_BACKWARD, 'sqlite': SQLITE_BACKWARD})),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['full_name_key', 'id'], name='student_name_key_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['email_key', 'id'], name='student_email_key_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['degree_level', 'full_name_key', 'id'], name='student_degree_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['level', 'full_name_key', 'id'], name='student_level_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['gender', 'full_name_key', 'id'], name='student_gender_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['semester_level', 'full_name_key', 'id'], name='student_semester_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['faculty', 'full_name_key', 'id'], name='student_faculty_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['major', 'full_name_key', 'id'], name='student_major_name_idx'),
+        ),
+    ]
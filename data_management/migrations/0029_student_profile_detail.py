@@ -0,0 +1,144 @@
+# Generated by Django 5.2.4 on 2026-10-17 04:18
+#
+# Moves the health, interest/achievement and organization fields of Student into the
+# one-to-one StudentProfileDetail table, so the student rows scanned by the list, counts and
+# filters stay narrow. Only students with something in those fields get a detail row; a
+# missing row reads as all blank (Student.detail).
+#
+# PostgreSQL drops the columns without rewriting the table; run VACUUM FULL (or pg_repack) on
+# data_management_student afterwards to give the space back. Removing the columns, and adding
+# them back when reversed, can make Django rebuild the student table on SQLite, so the search
+# and sort key triggers are dropped around it as in 0028_student_sort_keys.
+
+from importlib import import_module
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+sort_keys = import_module('data_management.migrations.0028_student_sort_keys')
+
+FIELDS = [
+    'disease_history', 'disease_status',
+    'sport_interest', 'sport_achievement', 'art_interest', 'art_achievement',
+    'literacy_interest', 'literacy_achievement', 'science_interest', 'science_achievement',
+    'mtq_interest', 'mtq_achievement', 'media_interest', 'media_achievement',
+    'organization_history',
+]
+
+MOVE_FORWARD = [
+    f"INSERT INTO data_management_studentprofiledetail (student_id, {', '.join(FIELDS)}) "
+    f"SELECT id, {', '.join(FIELDS)} FROM data_management_student "
+    + 'WHERE ' + ' OR '.join(f"{field} <> ''" for field in FIELDS),
+]
+
+MOVE_BACKWARD = [
+    'UPDATE data_management_student SET '
+    + ', '.join(f'{field} = (SELECT d.{field} FROM data_management_studentprofiledetail d '
+                f'WHERE d.student_id = data_management_student.id)' for field in FIELDS)
+    + ' WHERE id IN (SELECT student_id FROM data_management_studentprofiledetail)',
+]
+
+SQLITE_DROP_TRIGGERS = [*sort_keys.SQLITE_DROP_TRIGGERS, *sort_keys.SEARCH_DROP_TRIGGERS]
+SQLITE_TRIGGERS = [*sort_keys.SEARCH_TRIGGERS, *sort_keys.SQLITE_TRIGGERS]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement, params=None)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_management', '0028_student_sort_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentProfileDetail',
+            fields=[
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='profile_detail', serialize=False, to='data_management.student')),
+                ('disease_history', models.CharField(blank=True, max_length=255, verbose_name='Riwayat Penyakit')),
+                ('disease_status', models.CharField(blank=True, choices=[('sembuh', 'Sembuh'), ('belum', 'Belum Sembuh')], max_length=10)),
+                ('sport_interest', models.CharField(blank=True, max_length=150, verbose_name='Minat Olahraga')),
+                ('sport_achievement', models.TextField(blank=True, verbose_name='Prestasi Olahraga')),
+                ('art_interest', models.CharField(blank=True, max_length=150, verbose_name='Minat Kesenian')),
+                ('art_achievement', models.TextField(blank=True, verbose_name='Prestasi Kesenian')),
+                ('literacy_interest', models.CharField(blank=True, max_length=150, verbose_name='Minat Literasi')),
+                ('literacy_achievement', models.TextField(blank=True, verbose_name='Prestasi Literasi')),
+                ('science_interest', models.CharField(blank=True, max_length=150, verbose_name='Minat Keilmuan')),
+                ('science_achievement', models.TextField(blank=True, verbose_name='Prestasi Keilmuan')),
+                ('mtq_interest', models.CharField(blank=True, max_length=150, verbose_name='Minat MTQ')),
+                ('mtq_achievement', models.TextField(blank=True, verbose_name='Prestasi MTQ')),
+                ('media_interest', models.CharField(blank=True, max_length=150, verbose_name='Minat Media')),
+                ('media_achievement', models.TextField(blank=True, verbose_name='Prestasi Media')),
+                ('organization_history', models.TextField(blank=True, verbose_name='Riwayat Organisasi')),
+            ],
+        ),
+        migrations.RunPython(run({'postgresql': MOVE_FORWARD, 'sqlite': MOVE_FORWARD}),
+                             run({'postgresql': MOVE_BACKWARD, 'sqlite': MOVE_BACKWARD})),
+        migrations.RunPython(run({'sqlite': SQLITE_DROP_TRIGGERS}), run({'sqlite': SQLITE_TRIGGERS})),
+        migrations.RemoveField(
+            model_name='student',
+            name='art_achievement',
+        ),
+        migrations.RemoveField(
+            model_name='student',
+            name='art_interest',
+        ),
+        migrations.RemoveField(
+            model_name='student',
+            name='disease_history',
+        ),
+        migrations.RemoveField(
+            model_name='student',
+            name='disease_status',
+        ),
+        migrations.RemoveField(
+            model_name='student',
+            name='literacy_achievement',
+        ),
+        migrations.RemoveField(
+            model_name='student',
+            name='literacy_interest',
+        ),
+        migrations.RemoveField(
+            model_name='student',
+            name='media_achievement',
+        ),
+        migrations.RemoveField(
+            model_name='student',
+            name='media_interest',
+        ),
+        migrations.RemoveField(
+            model_name='student',
+            name='mtq_achievement',
+        ),
+        migrations.RemoveField(
+            model_name='student',
+            name='mtq_interest',
+        ),
+        migrations.RemoveField(
+            model_name='student',
+            name='organization_history',
+        ),
+        migrations.RemoveField(
+            model_name='student',
+            name='science_achievement',
+        ),
+        migrations.RemoveField(
+            model_name='student',
+            name='science_interest',
+        ),
+        migrations.RemoveField(
+            model_name='student',
+            name='sport_achievement',
+        ),
+        migrations.RemoveField(
+            model_name='student',
+            name='sport_interest',
+        ),
+        migrations.RunPython(run({'sqlite': SQLITE_TRIGGERS}), run({'sqlite': SQLITE_DROP_TRIGGERS})),
+    ]
@@ -0,0 +1,94 @@
+# Generated by Django 5.2.4 on 2026-10-17 12:10
+#
+# Student.full_name falls back to the username when the user has no name; make full_name_key
+# (0028_student_sort_keys) do the same, so nameless students sort where their name is shown
+# instead of first. The username is now part of the key, so a username change refreshes it too.
+
+from importlib import import_module
+
+from django.conf import settings
+from django.db import migrations
+
+sort_keys = import_module('data_management.migrations.0028_student_sort_keys')
+
+PG_FORWARD = [
+    """CREATE OR REPLACE FUNCTION data_management_student_sort_keys() RETURNS trigger AS $$
+    BEGIN
+        SELECT coalesce(nullif(lower(trim(concat_ws(' ', u.first_name, u.last_name))), ''), lower(u.username)),
+               lower(u.email)
+          INTO NEW.full_name_key, NEW.email_key
+          FROM auth_user u WHERE u.id = NEW.user_id;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql""",
+    # data_management_user_search_document() (0024) touches user_id, which re-runs the key trigger
+    """CREATE TRIGGER data_management_user_sort_keys
+        AFTER UPDATE OF username ON auth_user
+        FOR EACH ROW
+        WHEN (OLD.username IS DISTINCT FROM NEW.username)
+        EXECUTE FUNCTION data_management_user_search_document()""",
+    "UPDATE data_management_student SET user_id = user_id WHERE full_name_key = ''",
+]
+
+PG_BACKWARD = [
+    'DROP TRIGGER IF EXISTS data_management_user_sort_keys ON auth_user',
+    sort_keys.PG_FORWARD[0].replace('CREATE FUNCTION', 'CREATE OR REPLACE FUNCTION', 1),
+    'UPDATE data_management_student SET user_id = user_id',
+]
+
+SQLITE_KEYS = """
+    UPDATE data_management_student
+       SET full_name_key = (SELECT coalesce(nullif(lower(trim(u.first_name || ' ' || u.last_name)), ''),
+                                            lower(u.username))
+                              FROM auth_user u WHERE u.id = data_management_student.user_id),
+           email_key = (SELECT lower(u.email) FROM auth_user u WHERE u.id = data_management_student.user_id)
+"""
+
+SQLITE_TRIGGERS = [
+    f"""CREATE TRIGGER data_management_student_sort_keys_insert AFTER INSERT ON data_management_student BEGIN
+        {SQLITE_KEYS} WHERE id = NEW.id;
+    END""",
+    f"""CREATE TRIGGER data_management_student_sort_keys_update
+        AFTER UPDATE OF user_id ON data_management_student BEGIN
+        {SQLITE_KEYS} WHERE id = NEW.id;
+    END""",
+    f"""CREATE TRIGGER data_management_user_sort_keys_update
+        AFTER UPDATE OF username, first_name, last_name, email ON auth_user BEGIN
+        {SQLITE_KEYS} WHERE user_id = NEW.id;
+    END""",
+]
+
+# same trigger names as in 0028
+SQLITE_DROP_TRIGGERS = sort_keys.SQLITE_DROP_TRIGGERS
+
+SQLITE_FORWARD = [
+    *SQLITE_DROP_TRIGGERS,
+    *SQLITE_TRIGGERS,
+    SQLITE_KEYS,
+]
+
+SQLITE_BACKWARD = [
+    *SQLITE_DROP_TRIGGERS,
+    *sort_keys.SQLITE_TRIGGERS,
+    sort_keys.SQLITE_KEYS,
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement, params=None)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_management', '0029_student_profile_detail'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(run({'postgresql': PG_FORWARD, 'sqlite': SQLITE_FORWARD}),
+                             run({'postgresql': PG_BACKWARD, 'sqlite': SQLITE_BACKWARD})),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.4 on 2026-10-17 05:04
+#
+# Export files move from the default storage (MEDIA_ROOT, served by nginx without a login) to
+# the private ``exports`` storage. The files already written under media/exports/ (job results
+# and cached downloads) are deleted along with their jobs; the next request writes them again.
+
+import data_management.utils.export_storage
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+
+def delete_public_exports(apps, schema_editor):
+    ExportJob = apps.get_model('data_management', 'ExportJob')
+    for name in ExportJob.objects.exclude(file='').values_list('file', flat=True):
+        default_storage.delete(name)
+    ExportJob.objects.all().delete()
+    try:
+        names = default_storage.listdir('exports/cache')[1]
+    except FileNotFoundError:
+        return
+    for name in names:
+        default_storage.delete(f'exports/cache/{name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_management', '0030_student_name_key_username'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_public_exports, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='exportjob',
+            name='file',
+            field=models.FileField(blank=True, storage=data_management.utils.export_storage.get_export_storage,
+                                   upload_to='jobs/'),
+        ),
+    ]
@@ -1,7 +1,38 @@
+import logging
 import uuid
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.utils import timezone
+
+from data_management.utils.export_storage import get_export_storage
+
+logger = logging.getLogger(__name__)
+
+# Student fields stored in StudentProfileDetail
+PROFILE_DETAIL_FIELDS = [
+    'disease_history', 'disease_status',
+    'sport_interest', 'sport_achievement', 'art_interest', 'art_achievement',
+    'literacy_interest', 'literacy_achievement', 'science_interest', 'science_achievement',
+    'mtq_interest', 'mtq_achievement', 'media_interest', 'media_achievement',
+    'organization_history',
+]
+
+
+def detail_field(name):
+    """Student attribute for ``name`` of the student's StudentProfileDetail; ``Student.save()`` stores changes."""
+    def get(student):
+        return getattr(student.detail, name)
+
+    def set(student, value):
+        detail = student.detail
+        if getattr(detail, name) != value:
+            setattr(detail, name, value)
+            student._detail_changed = True
+
+    # a property, so that Student(**kwargs) accepts it
+    return property(get, set, doc=f'``StudentProfileDetail.{name}`` of this student.')
 
 
 class Student(models.Model):
@@ -57,30 +88,26 @@ class Student(models.Model):
     level = models.CharField(max_length=20, choices=LEVEL_CHOICES, default='maba', db_index=True)
     is_draft = models.BooleanField(default=False)  # indicates incomplete / draft record managed by staff
 
-    # Health Information
+    # Health information, interests and talents, organizational history: kept in StudentProfileDetail
     DISEASE_STATUS_CHOICES = [
         ('sembuh', 'Sembuh'),
         ('belum', 'Belum Sembuh'),
     ]
-    disease_history = models.CharField(max_length=255, blank=True, verbose_name="Riwayat Penyakit")
-    disease_status = models.CharField(max_length=10, choices=DISEASE_STATUS_CHOICES, blank=True)
-
-    # Interests and Talents
-    sport_interest = models.CharField(max_length=150, blank=True, verbose_name="Minat Olahraga")
-    sport_achievement = models.TextField(blank=True, verbose_name="Prestasi Olahraga")
-    art_interest = models.CharField(max_length=150, blank=True, verbose_name="Minat Kesenian")
-    art_achievement = models.TextField(blank=True, verbose_name="Prestasi Kesenian")
-    literacy_interest = models.CharField(max_length=150, blank=True, verbose_name="Minat Literasi")
-    literacy_achievement = models.TextField(blank=True, verbose_name="Prestasi Literasi")
-    science_interest = models.CharField(max_length=150, blank=True, verbose_name="Minat Keilmuan")
-    science_achievement = models.TextField(blank=True, verbose_name="Prestasi Keilmuan")
-    mtq_interest = models.CharField(max_length=150, blank=True, verbose_name="Minat MTQ")
-    mtq_achievement = models.TextField(blank=True, verbose_name="Prestasi MTQ")
-    media_interest = models.CharField(max_length=150, blank=True, verbose_name="Minat Media")
-    media_achievement = models.TextField(blank=True, verbose_name="Prestasi Media")
-
-    # Organizational History
-    organization_history = models.TextField(blank=True, verbose_name="Riwayat Organisasi")
+    disease_history = detail_field('disease_history')
+    disease_status = detail_field('disease_status')
+    sport_interest = detail_field('sport_interest')
+    sport_achievement = detail_field('sport_achievement')
+    art_interest = detail_field('art_interest')
+    art_achievement = detail_field('art_achievement')
+    literacy_interest = detail_field('literacy_interest')
+    literacy_achievement = detail_field('literacy_achievement')
+    science_interest = detail_field('science_interest')
+    science_achievement = detail_field('science_achievement')
+    mtq_interest = detail_field('mtq_interest')
+    mtq_achievement = detail_field('mtq_achievement')
+    media_interest = detail_field('media_interest')
+    media_achievement = detail_field('media_achievement')
+    organization_history = detail_field('organization_history')
 
     # Financial Information
     education_funding = models.CharField(
@@ -126,6 +153,28 @@ class Student(models.Model):
         verbose_name="Nomor HP Wali/Umdah"
     )
 
+    # Digest of the normalized CSV row this student was last imported from (see
+    # utils.student_import.content_hash); re-imports skip rows whose digest is unchanged.
+    import_hash = models.CharField(max_length=32, blank=True, editable=False)
+
+    # Lower-cased copies of the user's full name and email for sorting and filtering without a join.
+    # The database keeps them in sync with auth_user (triggers, migration 0028_student_sort_keys).
+    full_name_key = models.CharField(max_length=301, blank=True, default='', editable=False)
+    email_key = models.CharField(max_length=254, blank=True, default='', editable=False)
+
+    class Meta:
+        # keyset pages of the staff list seek on (sort field, full_name_key, id); see utils.student_query
+        indexes = [
+            models.Index(fields=['full_name_key', 'id'], name='student_name_key_idx'),
+            models.Index(fields=['email_key', 'id'], name='student_email_key_idx'),
+            models.Index(fields=['degree_level', 'full_name_key', 'id'], name='student_degree_name_idx'),
+            models.Index(fields=['level', 'full_name_key', 'id'], name='student_level_name_idx'),
+            models.Index(fields=['gender', 'full_name_key', 'id'], name='student_gender_name_idx'),
+            models.Index(fields=['semester_level', 'full_name_key', 'id'], name='student_semester_name_idx'),
+            models.Index(fields=['faculty', 'full_name_key', 'id'], name='student_faculty_name_idx'),
+            models.Index(fields=['major', 'full_name_key', 'id'], name='student_major_name_idx'),
+        ]
+
     def clean(self):
         from django.core.exceptions import ValidationError
         if self.semester_level < 1 or self.semester_level > 14:
@@ -133,6 +182,38 @@ class Student(models.Model):
 
         # Optionally, add phone number validation here
 
+    def save(self, *args, **kwargs):
+        # Edits made outside an import invalidate the import hash so the next import rewrites the row.
+        if not getattr(self, '_keep_import_hash', False) and self.import_hash:
+            self.import_hash = ''
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'import_hash'}
+        super().save(*args, **kwargs)
+        if getattr(self, '_detail_changed', False):
+            self.detail.save(force_insert=self.detail._state.adding)
+            self._detail_changed = False
+
+    @property
+    def detail(self):
+        """The StudentProfileDetail row, read on first use; an unsaved blank one when there is none yet.
+
+        Pages that show it load it with ``select_related('profile_detail')``.
+        """
+        if self._state.adding and not Student.profile_detail.related.is_cached(self):
+            self.profile_detail = StudentProfileDetail(student=self)
+        try:
+            return self.profile_detail
+        except StudentProfileDetail.DoesNotExist:
+            self.profile_detail = StudentProfileDetail(student=self)
+            return self.profile_detail
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        # Django loads a deferred field through here, one query per row (see utils.student_columns)
+        if settings.DEBUG and fields and self.get_deferred_fields().issuperset(fields):
+            logger.warning('Deferred Student field(s) %s loaded for one row; add them to the listing\'s only()',
+                           ', '.join(fields))
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+
     @property
     def email(self):
         """Get email from related user model"""
@@ -148,3 +229,117 @@ class Student(models.Model):
 
     def __str__(self):
         return self.full_name
+
+
+class StudentProfileDetail(models.Model):
+    """
+    The rarely read part of a student's profile: health information,
+    interests and achievements, organizational history.
+
+    Kept out of the student table so that the list, count and filter scans
+    read narrow rows; only the detail and edit pages load it. The fields
+    are also Student attributes (see ``detail_field``). A student without
+    a row has all of them blank.
+    """
+
+    student = models.OneToOneField(Student, on_delete=models.CASCADE, primary_key=True, related_name='profile_detail')
+
+    # Health Information
+    disease_history = models.CharField(max_length=255, blank=True, verbose_name="Riwayat Penyakit")
+    disease_status = models.CharField(max_length=10, choices=Student.DISEASE_STATUS_CHOICES, blank=True)
+
+    # Interests and Talents
+    sport_interest = models.CharField(max_length=150, blank=True, verbose_name="Minat Olahraga")
+    sport_achievement = models.TextField(blank=True, verbose_name="Prestasi Olahraga")
+    art_interest = models.CharField(max_length=150, blank=True, verbose_name="Minat Kesenian")
+    art_achievement = models.TextField(blank=True, verbose_name="Prestasi Kesenian")
+    literacy_interest = models.CharField(max_length=150, blank=True, verbose_name="Minat Literasi")
+    literacy_achievement = models.TextField(blank=True, verbose_name="Prestasi Literasi")
+    science_interest = models.CharField(max_length=150, blank=True, verbose_name="Minat Keilmuan")
+    science_achievement = models.TextField(blank=True, verbose_name="Prestasi Keilmuan")
+    mtq_interest = models.CharField(max_length=150, blank=True, verbose_name="Minat MTQ")
+    mtq_achievement = models.TextField(blank=True, verbose_name="Prestasi MTQ")
+    media_interest = models.CharField(max_length=150, blank=True, verbose_name="Minat Media")
+    media_achievement = models.TextField(blank=True, verbose_name="Prestasi Media")
+
+    # Organizational History
+    organization_history = models.TextField(blank=True, verbose_name="Riwayat Organisasi")
+
+    def __str__(self):
+        return f'Profile detail of {self.student_id}'
+
+
+class CommandLock(models.Model):
+    """Lease held by a running management command; see ``utils.command_lock``."""
+
+    name = models.CharField(max_length=100, primary_key=True)
+    token = models.CharField(max_length=32)
+    command = models.CharField(max_length=100)
+    host = models.CharField(max_length=255)
+    pid = models.PositiveIntegerField()
+    acquired_at = models.DateTimeField()
+    renewed_at = models.DateTimeField()
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f'{self.name} ({self.command} on {self.host}, pid {self.pid})'
+
+
+class ExportJob(models.Model):
+    """Student export written in the background; see ``utils.export_jobs``."""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # identifies the filters + columns; a finished, non-stale job with the same key is reused
+    key = models.CharField(max_length=40, db_index=True)
+    params = models.JSONField(default=dict)
+    columns = models.CharField(max_length=20)
+    requested_by = models.ForeignKey(get_user_model(), null=True, on_delete=models.SET_NULL, related_name='+')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    rows_done = models.PositiveIntegerField(default=0)
+    rows_total = models.PositiveIntegerField(null=True, blank=True)
+    file = models.FileField(upload_to='jobs/', storage=get_export_storage, blank=True)
+    error = models.TextField(blank=True)
+    # set when student data changes; stale exports are never handed out again
+    stale = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def is_active(self):
+        return self.status in (self.QUEUED, self.RUNNING)
+
+    @property
+    def progress(self):
+        if self.status == self.DONE:
+            return 100
+        if not self.rows_total:
+            return 0
+        return min(99, self.rows_done * 100 // self.rows_total)
+
+    def __str__(self):
+        return f'{self.columns} export {self.pk} ({self.status})'
+
+
+class DataVersion(models.Model):
+    """Change counter of a data set; see ``utils.data_version``."""
+
+    name = models.CharField(max_length=50, primary_key=True)
+    number = models.PositiveBigIntegerField(default=0)
+    changed_at = models.DateTimeField(default=timezone.now)
+    # rows in the data set, where maintained (see ``utils.student_counts``); null until counted
+    row_count = models.BigIntegerField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.name} v{self.number}'
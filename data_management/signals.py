@@ -1,15 +1,24 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
 from django.contrib.auth import get_user_model
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
 from .models import Student
+from .utils.data_version import student_data_changed
+from .utils.student_counts import students_added
 
 User = get_user_model()
 
+# set by profile_signal_disabled()/change_signals_disabled(); context variables, so other threads keep the signals
+_profile_signal_off = ContextVar('profile_signal_off', default=False)
+_change_signals_off = ContextVar('change_signals_off', default=False)
+
 
 @receiver(post_save, sender=User)
 def create_profile(sender, instance, created, **kwargs):
-    if created:
+    if created and not _profile_signal_off.get():
         print(f"Creating profile for user: {instance}")
         Student.objects.create(
             user=instance,  # <-- use the User instance, not username
@@ -19,3 +28,66 @@ def create_profile(sender, instance, created, **kwargs):
             degree_level='S1',
             semester_level=1,
         )
+
+
+@receiver(post_save, sender=User)
+def invalidate_import_hash(sender, instance, created, update_fields=None, **kwargs):
+    """Names and emails are part of the import hash, so user edits force the next import to rewrite the row."""
+    if _change_signals_off.get() or created or (update_fields is not None and set(update_fields) <= {'last_login', 'password'}):
+        return
+    Student.objects.filter(user=instance).exclude(import_hash='').update(import_hash='')
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+@receiver(post_delete, sender=User)
+def student_changed(sender, **kwargs):
+    if not _change_signals_off.get():
+        student_data_changed()
+
+
+@receiver(post_save, sender=Student)
+def count_created_student(sender, created, **kwargs):
+    if created and not _change_signals_off.get():
+        students_added(1)
+
+
+@receiver(post_delete, sender=Student)
+def count_deleted_student(sender, **kwargs):
+    if not _change_signals_off.get():
+        students_added(-1)
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created, update_fields=None, **kwargs):
+    # logins and password changes are not exported
+    if _change_signals_off.get():
+        return
+    if update_fields is not None and set(update_fields) <= {'last_login', 'password'}:
+        return
+    student_data_changed()
+
+
+@contextmanager
+def profile_signal_disabled():
+    """Turn ``create_profile`` off in this context for code that creates the Student rows itself (e.g. bulk imports)."""
+    token = _profile_signal_off.set(True)
+    try:
+        yield
+    finally:
+        _profile_signal_off.reset(token)
+
+
+@contextmanager
+def change_signals_disabled():
+    """
+    Turn the data version, student count and import hash receivers off in this context.
+
+    For imports: the importer writes the import hash itself, and the caller
+    must call ``student_data_changed()`` and ``recount_students()`` when done.
+    """
+    token = _change_signals_off.set(True)
+    try:
+        yield
+    finally:
+        _change_signals_off.reset(token)
@@ -1,10 +1,40 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import os
+import shutil
+import smtplib
+import tempfile
+import zipfile
+from datetime import date, timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.core import mail
+from django.core.files.storage import default_storage, storages
+from django.core.mail.backends import locmem
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.http import StreamingHttpResponse
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
-from .models import Student
+from .forms import StaffStudentForm
+from .models import CommandLock, DataVersion, ExportJob, Student, StudentProfileDetail
+from .utils.export_formats import pyarrow
+from .utils.export_jobs import run_export_job
+from .utils.student_counts import Count, count_students, facet_counts, recount_students, total_students
+from .utils.student_import import BulkStudentImporter, ColumnPlan
+from .utils.student_query import DEFAULT_ORDERING, filter_students, sort_students
+
+
+class StaffTestCase(TestCase):
+    """Logged in as a member of the staff group."""
 
-class TestStaffStudentCreation(TestCase):
     def setUp(self):
         User = get_user_model()
         # Ensure staff group exists
@@ -12,7 +42,16 @@ class TestStaffStudentCreation(TestCase):
         self.staff_user = User.objects.create_user(username='staff', email='staff@example.com', password='pass12345', is_staff=True)
         self.staff_user.groups.add(self.staff_group)
         self.client.login(username='staff', password='pass12345')
+        # exports write files (job results, cached downloads) to the exports storage
+        storage_dirs = {alias: tempfile.mkdtemp() for alias in ['default', 'exports']}
+        for storage_dir in storage_dirs.values():
+            self.addCleanup(shutil.rmtree, storage_dir)
+        self.enterContext(override_settings(STORAGES={**settings.STORAGES, **{
+            alias: {'BACKEND': 'django.core.files.storage.FileSystemStorage', 'OPTIONS': {'location': storage_dir}}
+            for alias, storage_dir in storage_dirs.items()}}))
 
+
+class TestStaffStudentCreation(StaffTestCase):
     def test_create_student_reuses_signal_student(self):
         url = reverse('staff_student_create')
         post_data = {
@@ -72,3 +111,705 @@ class TestStaffStudentCreation(TestCase):
         self.assertEqual(student.degree_level, 'S2')
         self.assertEqual(student.semester_level, 4)
         self.assertEqual(student.gender, 'F')
+
+
+class TestStudentListView(StaffTestCase):
+    def test_sort_keys_follow_user_changes(self):
+        User = get_user_model()
+        for username, first_name in [('ahmad', 'ahmad'), ('budi', 'Budi'), ('aaron', 'AARON')]:
+            User.objects.create_user(username=username, email=f'{username.title()}@Example.com', first_name=first_name,
+                                     last_name='Putra')
+        self.assertEqual(Student.objects.get(user__username='budi').email_key, 'budi@example.com')
+        budi = User.objects.get(username='budi')
+        budi.first_name = 'Abdul'
+        budi.save()
+        Student.objects.filter(user__username='aaron').update(degree_level='S2')
+
+        def usernames(params):
+            qs = sort_students(Student.objects.exclude(user=self.staff_user).order_by(DEFAULT_ORDERING), params)
+            return list(qs.values_list('user__username', flat=True))
+
+        self.assertEqual(usernames({}), ['aaron', 'budi', 'ahmad'])
+        # ties on the sort field are ordered by name, in the same direction
+        self.assertEqual(usernames({'sort': 'degree_level', 'dir': 'desc'}), ['aaron', 'ahmad', 'budi'])
+        # sort names from before the keys still work
+        self.assertEqual(usernames({'sort': 'user__first_name', 'dir': 'desc'}), ['ahmad', 'budi', 'aaron'])
+        # like Student.full_name, a user without a name sorts by username
+        User.objects.create_user(username='Adi', email='adi@example.com')
+        self.assertEqual(usernames({}), ['aaron', 'budi', 'Adi', 'ahmad'])
+        User.objects.filter(username='Adi').update(username='zaki')
+        self.assertEqual(usernames({})[-1], 'zaki')
+
+    @override_settings(VITE_DEV_MODE=True)  # full pages without a built frontend
+    def test_student_list_pages_by_cursor(self):
+        for index in range(12):
+            get_user_model().objects.create_user(username=f'user{index:02}', email=f'user{index:02}@example.com',
+                                                 first_name=f'User {index:02}')
+        url = reverse('data_management:staff_student_list')
+
+        def names(response):
+            return [student.user.username for student in response.context['students']]
+
+        first = self.client.get(url, {'sort': 'full_name_key'})
+        self.assertEqual(names(first), ['staff'] + [f'user{index:02}' for index in range(9)])
+        self.assertFalse(first.context['page_obj'].has_previous)
+        second = self.client.get(url, {'sort': 'full_name_key', 'cursor': first.context['page_obj'].next_cursor})
+        self.assertEqual(names(second), ['user09', 'user10', 'user11'])
+        self.assertFalse(second.context['page_obj'].has_next)
+        back = self.client.get(url, {'sort': 'full_name_key', 'cursor': second.context['page_obj'].previous_cursor})
+        self.assertEqual(names(back), names(first))
+        # "load more" asks for the rows only
+        more = self.client.get(url, {'cursor': first.context['page_obj'].next_cursor},
+                               HTTP_HX_REQUEST='true', HTTP_HX_TARGET='load-more')
+        self.assertTemplateUsed(more, 'dashboard/staff/partials/student_rows.html')
+        self.assertTemplateNotUsed(more, 'dashboard/staff/staff_dashboard_list.html')
+        # page numbers still work when asked for
+        self.assertEqual(names(self.client.get(url, {'page': 2})), ['user09', 'user10', 'user11'])
+
+    @override_settings(VITE_DEV_MODE=True,
+                       CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_student_list_htmx_fragments_and_cached_rows(self):
+        get_user_model().objects.create_user(username='ahmad', email='ahmad@example.com', first_name='Ahmad')
+        Student.objects.filter(user__username='ahmad').update(faculty='Ushuluddin')
+        url = reverse('data_management:staff_student_list')
+        htmx = {'HTTP_HX_REQUEST': 'true', 'HTTP_HX_TARGET': 'student-list'}
+
+        response = self.client.get(url, {'sort': 'faculty'}, **htmx)
+        self.assertTemplateUsed(response, 'dashboard/staff/partials/student_list.html')
+        self.assertTemplateNotUsed(response, 'base.html')
+        self.assertNotContains(response, 'id="filter-choices"')
+        self.assertContains(response, 'Ushuluddin')
+        # the filter form also refreshes the header and the option counts
+        response = self.client.get(url, {'gender': 'M'}, HTTP_HX_TRIGGER='student-filters', **htmx)
+        self.assertContains(response, 'id="filter-choices" class="contents" hx-swap-oob="true"')
+        self.assertContains(response, 'id="student-actions"')
+
+        # rows come from the fragment cache until the data version moves
+        Student.objects.filter(user__username='ahmad').update(faculty='Syariah')  # no signals
+        self.assertContains(self.client.get(url, **htmx), 'Ushuluddin')
+        Student.objects.get(user__username='ahmad').save()
+        self.assertContains(self.client.get(url, **htmx), 'Syariah')
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_student_counts_are_maintained_and_cached(self):
+        User = get_user_model()
+        self.assertEqual(total_students(), 1)
+        for username in ['ahmad', 'budi']:
+            User.objects.create_user(username=username, email=f'{username}@example.com', first_name=username.title())
+        with self.assertNumQueries(1):
+            self.assertEqual(total_students(), 3)
+        User.objects.get(username='budi').delete()
+        self.assertEqual(total_students(), 2)
+        # a lost counter is rebuilt from the table
+        DataVersion.objects.update(row_count=None)
+        self.assertEqual(total_students(), 2)
+
+        def count(q):
+            return count_students(filter_students(Student.objects.all(), {'q': q}), {'q': q})
+
+        self.assertEqual(count('ahmad'), Count(1, False))
+        with self.assertNumQueries(1):  # the data version
+            self.assertEqual(count('ahmad'), Count(1, False))
+        User.objects.create_user(username='ahmadi', email='ahmadi@example.com', first_name='Ahmadi')
+        self.assertEqual(count('ahmad'), Count(2, False))
+
+    def test_facet_counts_come_from_one_query(self):
+        User = get_user_model()
+        for username, degree, status in [('ahmad', 'S2', 'married'), ('budi', 'S1', 'single'), ('aaron', 'S2', 'single')]:
+            User.objects.create_user(username=username, email=f'{username}@example.com', first_name=username.title())
+            Student.objects.filter(user__username=username).update(degree_level=degree, marital_status=status)
+
+        with self.assertNumQueries(2):  # the data version and the aggregate
+            facets = facet_counts({'degree_level': 'S2', 'marital_status': 'single'})
+        # a field is counted without its own filter
+        self.assertEqual(facets['degree_level'][2:4], [('S1', 'S1', 2), ('S2', 'S2', 1)])
+        self.assertEqual(facets['marital_status'], [('single', 'Single', 1), ('married', 'Married', 1)])
+        self.assertEqual(facets['gender'], [('M', 'Male', 1), ('F', 'Female', 0)])
+        self.assertEqual(facet_counts({'q': 'ahmad'})['degree_level'][3], ('S2', 'S2', 1))
+
+    @override_settings(VITE_DEV_MODE=True)
+    def test_listings_load_only_rendered_columns(self):
+        get_user_model().objects.create_user(username='ahmad', email='ahmad@example.com', first_name='Ahmad')
+        Student.objects.filter(user__username='ahmad').update(home_location='Hay Asyir')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('data_management:staff_student_list'))
+        self.assertContains(response, 'Ahmad')
+        student_queries = [q['sql'] for q in queries.captured_queries if 'FROM "data_management_student"' in q['sql']]
+        self.assertTrue(student_queries)
+        self.assertFalse([sql for sql in student_queries if 'home_location' in sql or 'password' in sql])
+
+        get_user_model().objects.filter(pk=self.staff_user.pk).update(is_superuser=True)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:data_management_student_changelist'))
+        self.assertContains(response, 'Ahmad')
+        self.assertFalse([q for q in queries.captured_queries if 'home_location' in q['sql']])
+        # a field left out of a listing costs a query per row, flagged in debug mode
+        student = Student.objects.only('level').get(user__username='ahmad')
+        with self.settings(DEBUG=True), self.assertLogs('data_management.models', 'WARNING'):
+            self.assertEqual(student.home_location, 'Hay Asyir')
+
+    @override_settings(VITE_DEV_MODE=True)
+    def test_profile_detail_fields_are_stored_apart(self):
+        get_user_model().objects.create_user(username='ahmad', email='ahmad@example.com', first_name='Ahmad')
+        student = Student.objects.get(user__username='ahmad')
+        self.assertEqual(student.sport_interest, '')
+        self.assertFalse(StudentProfileDetail.objects.exists())
+
+        form = StaffStudentForm({'gender': 'M', 'marital_status': 'single', 'degree_level': 'S1', 'semester_level': 1,
+                                 'level': 'maba', 'sport_interest': 'Sepak bola', 'disease_status': 'sembuh'},
+                                instance=student)
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        detail = StudentProfileDetail.objects.get(student=student)
+        self.assertEqual((detail.sport_interest, detail.disease_status), ('Sepak bola', 'sembuh'))
+        self.assertEqual(StaffStudentForm(instance=Student.objects.get(pk=student.pk)).initial['sport_interest'],
+                         'Sepak bola')
+        # the list and its counts never read the detail table; the detail page does
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('data_management:staff_student_list'))
+        self.assertFalse([q for q in queries.captured_queries if 'studentprofiledetail' in q['sql']])
+        response = self.client.get(reverse('data_management:staff_student_detail', args=[student.pk]))
+        self.assertContains(response, 'Sepak bola')
+
+
+class TestStudentSearch(StaffTestCase):
+    def test_search_matches_word_prefixes_ranked_by_field(self):
+        User = get_user_model()
+        for username, first_name, last_name in [('ahmad', 'Ahmad', 'Putra'), ('budi', 'Budi', 'Santoso'),
+                                                ('aaron', 'Aaron', 'Hakim')]:
+            User.objects.create_user(username=username, email=f'{username}@example.com', first_name=first_name,
+                                     last_name=last_name)
+        Student.objects.filter(user__username='aaron').update(faculty='Ahmadiyah Studies')
+
+        def search(q):
+            qs = filter_students(Student.objects.order_by(DEFAULT_ORDERING), {'q': q})
+            return [student.user.username for student in qs.select_related('user')]
+
+        self.assertEqual(search('ahm put'), ['ahmad'])
+        # a name match ranks above a faculty match
+        self.assertEqual(search('ahmad'), ['ahmad', 'aaron'])
+        budi = User.objects.get(username='budi')
+        budi.last_name = 'Ahmadi'
+        budi.save()
+        self.assertEqual(search('ahmad'), ['ahmad', 'budi', 'aaron'])
+        self.assertEqual(search('santoso'), [])
+
+    def test_identifier_lookup_matches_inside_the_value(self):
+        for username, nik in [('ahmad', '3201234567890001'), ('budi', '3301999967890002')]:
+            get_user_model().objects.create_user(username=username, email=f'{username}@example.com')
+            Student.objects.filter(user__username=username).update(nik=nik)
+
+        def lookup(q):
+            qs = filter_students(Student.objects.order_by(DEFAULT_ORDERING), {'q': q, 'match': 'id'})
+            return sorted(qs.values_list('user__username', flat=True))
+
+        self.assertEqual(lookup('2345 678'), ['ahmad'])
+        self.assertEqual(lookup('6789000'), ['ahmad', 'budi'])
+        self.assertEqual(lookup('%'), [])
+
+    def test_search_field_clauses_and_detected_identifiers(self):
+        User = get_user_model()
+        for username, nik, passport, faculty, degree in [
+                ('ahmad', '1371021310040003', 'E3555146', 'Lughah Arabiyyah', 'S2'),
+                ('budi', '1371021310040004', 'e3555200', 'Ushuluddin', 'S1')]:
+            User.objects.create_user(username=username, email=f'{username}@example.com', first_name=username.title())
+            Student.objects.filter(user__username=username).update(
+                nik=nik, passport_number=passport, faculty=faculty, degree_level=degree)
+
+        def search(q):
+            qs = filter_students(Student.objects.order_by(DEFAULT_ORDERING), {'q': q})
+            return list(qs.values_list('user__username', flat=True))
+
+        self.assertEqual(search('1371021310040004'), ['budi'])
+        self.assertEqual(search('nik:13710213'), ['ahmad', 'budi'])
+        self.assertEqual(search('passport:E3555'), ['ahmad', 'budi'])
+        self.assertEqual(search('BUDI@example.com'), ['budi'])
+        self.assertEqual(search('email:ahm'), ['ahmad'])
+        self.assertEqual(search('faculty:"lughah arab" degree:s2'), ['ahmad'])
+        self.assertEqual(search('degree:S3'), [])
+        self.assertEqual(search('budi passport:E3555'), ['budi'])
+
+    def test_suggest_matches_name_and_identifier_prefixes(self):
+        User = get_user_model()
+        for username, first_name, last_name, passport in [('ahmad', 'Ahmad', 'Putra', 'E3555146'),
+                                                          ('budi', 'Budi', 'Ahmadi', 'B1234567')]:
+            User.objects.create_user(username=username, email=f'{username}@example.com', first_name=first_name,
+                                     last_name=last_name)
+            Student.objects.filter(user__username=username).update(passport_number=passport)
+        url = reverse('data_management:staff_student_suggest')
+
+        def names(q):
+            return [result['name'] for result in self.client.get(url, {'q': q}).json()['results']]
+
+        # an exact key sorts before longer ones
+        self.assertEqual(names('AHMAD'), ['Ahmad Putra', 'Budi Ahmadi'])
+        self.assertEqual(names('ahmad pu'), ['Ahmad Putra'])
+        self.assertEqual(names('e355'), ['Ahmad Putra'])
+        self.assertEqual(names(''), [])
+        # the index follows the data version
+        User.objects.create_user(username='ahmed', email='ahmed@example.com', first_name='Ahmed')
+        self.assertEqual(names('ahm'), ['Ahmad Putra', 'Budi Ahmadi', 'Ahmed'])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(names('ahme'), ['Ahmed'])
+        self.assertFalse([query for query in queries if 'data_management_student' in query['sql']])
+        self.assertContains(self.client.get(url, {'q': 'budi'}, HTTP_HX_REQUEST='true'),
+                            '<option value="Budi Ahmadi">budi@example.com · B1234567</option>', html=True)
+
+
+class TestStudentExport(StaffTestCase):
+    def test_export_csv_streams_filtered_rows_with_constant_queries(self):
+        User = get_user_model()
+        url = reverse('data_management:export_students_csv')
+
+        def add_students(names):
+            for name in names:
+                User.objects.create_user(username=name, email=f'{name}@example.com', first_name=name.title(),
+                                         last_name='Putra')
+            Student.objects.filter(user__username__in=names).update(faculty='Ushuluddin')
+
+        def export(params):
+            response = self.client.get(url, params)
+            self.assertIsInstance(response, StreamingHttpResponse)
+            return list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+
+        add_students(['ahmad', 'budi'])
+        with CaptureQueriesContext(connection) as small:
+            rows = export({'q': 'putra'})
+        self.assertEqual(rows[1:], [
+            ['Ahmad Putra', 'ahmad@example.com', '', '', 'S1', '1', 'Ushuluddin', '', 'Mahasiswa Baru'],
+            ['Budi Putra', 'budi@example.com', '', '', 'S1', '1', 'Ushuluddin', '', 'Mahasiswa Baru'],
+        ])
+        add_students([f'student{i}' for i in range(20)])
+        with CaptureQueriesContext(connection) as large:
+            rows = export({'q': 'putra', 'sort': 'email_key', 'dir': 'desc'})
+        self.assertEqual(len(rows), 23)
+        self.assertEqual(rows[-1][1], 'ahmad@example.com')
+        self.assertEqual(len(large), len(small))
+
+    def test_export_formats_keep_value_types(self):
+        get_user_model().objects.create_user(username='ahmad', email='ahmad@example.com', first_name='Ahmad')
+        Student.objects.filter(user__username='ahmad').update(latest_grade='3.75', birth_date='2001-02-03')
+        url = reverse('data_management:export_students')
+
+        def export(format_name):
+            response = self.client.get(url, {'format': format_name, 'columns': 'all', 'q': 'ahmad'})
+            self.assertIsInstance(response, StreamingHttpResponse)
+            return response, b''.join(response.streaming_content)
+
+        response, content = export('ndjson')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="students-all.ndjson.gz"')
+        row = json.loads(gzip.decompress(content))
+        self.assertEqual((row['username'], row['birth_date'], row['latest_grade'], row['semester_level']),
+                         ('ahmad', '2001-02-03', 3.75, 1))
+
+        response, content = export('xlsx')
+        sheet = zipfile.ZipFile(BytesIO(content)).read('xl/worksheets/sheet1.xml').decode()
+        self.assertIn('<c s="1"><v>36925</v></c>', sheet)  # 2001-02-03 as an Excel date
+        self.assertIn('<c><v>3.75</v></c>', sheet)
+
+        if pyarrow is not None:
+            response, content = export('parquet')
+            table = pyarrow.parquet.read_table(pyarrow.BufferReader(content))
+            self.assertEqual(table.schema.field('latest_grade').type, pyarrow.decimal128(4, 2))
+            self.assertEqual(table.column('birth_date').to_pylist(), [date(2001, 2, 3)])
+        self.assertEqual(self.client.get(url, {'format': 'pdf'}).status_code, 400)
+
+    def test_export_is_cached_until_student_data_changes(self):
+        get_user_model().objects.create_user(username='ahmad', email='ahmad@example.com', first_name='Ahmad')
+        url = reverse('data_management:export_students') + '?q=ahmad'
+
+        first = self.client.get(url)
+        self.assertIn(b'Ahmad', b''.join(first.streaming_content))
+        with CaptureQueriesContext(connection) as queries:
+            cached = self.client.get(url)
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertIn(b'Ahmad', b''.join(cached.streaming_content))
+        self.assertEqual(cached['ETag'], first['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertFalse([q for q in queries if 'data_management_student' in q['sql']])
+        self.assertEqual(len(storages['exports'].listdir('cache')[1]), 1)
+        self.assertEqual(default_storage.listdir(''), ([], []))
+
+        student = Student.objects.get(user__username='ahmad')
+        student.faculty = 'Ushuluddin'
+        student.save()
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], first['ETag'])
+        self.assertIn(b'Ushuluddin', b''.join(changed.streaming_content))
+
+    def test_export_job_writes_file_and_is_reused_until_data_changes(self):
+        get_user_model().objects.create_user(username='ahmad', email='ahmad@example.com', first_name='Ahmad')
+        create_url = reverse('data_management:export_job_create') + '?q=ahmad'
+
+        # run the job inline instead of on a thread, inside the test transaction
+        with mock.patch('data_management.utils.export_jobs.start_job', run_export_job):
+            response = self.client.post(create_url)
+            job = ExportJob.objects.get()
+            self.assertContains(response, 'hx-trigger="every 1s"')
+            response = self.client.get(reverse('data_management:export_job_status', args=[job.pk]))
+            self.assertNotContains(response, 'hx-trigger')
+            self.assertContains(response, reverse('data_management:export_job_download', args=[job.pk]))
+
+            # not in the default storage, which nginx serves under /media/ without a login
+            job.refresh_from_db()
+            self.assertTrue(storages['exports'].exists(job.file.name))
+            self.assertEqual(default_storage.listdir(''), ([], []))
+            response = self.client.get(reverse('data_management:export_job_download', args=[job.pk]))
+            rows = list(csv.DictReader(b''.join(response.streaming_content).decode().splitlines()))
+            self.assertEqual([(row['username'], row['email'], row['full_name']) for row in rows],
+                             [('ahmad', 'ahmad@example.com', 'Ahmad')])
+            self.assertIn('organization_history', rows[0])
+
+            self.client.post(create_url)
+            self.assertEqual(ExportJob.objects.count(), 1)
+            Student.objects.get(user__username='ahmad').save()
+            self.client.post(create_url)
+            self.assertEqual(ExportJob.objects.get().status, ExportJob.DONE)
+            self.assertNotEqual(ExportJob.objects.get().pk, job.pk)
+
+
+class TestSeedStudentsFromCsvBulk(TestCase):
+    HEADER = 'email,full_name,passport_number,nik,gender,marital_status,degree_level,semester_level,birth_date,username\n'
+
+    def write_csv(self, rows, header=None):
+        handle = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8')
+        handle.write((header or self.HEADER) + ''.join(rows))
+        handle.close()
+        self.addCleanup(os.unlink, handle.name)
+        for sidecar in (handle.name[:-4] + '.rejects.csv', handle.name + '.checkpoint'):
+            self.addCleanup(lambda path=sidecar: os.path.exists(path) and os.unlink(path))
+        return handle.name
+
+    def run_import(self, path, **options):
+        out = StringIO()
+        call_command('seed_students_from_csv', csv=path, stdout=out, **{'bulk': True, **options})
+        return out.getvalue()
+
+    def test_bulk_import_creates_one_student_per_user(self):
+        path = self.write_csv([
+            'ali@example.com,Ali Akbar,P100,1111,M,single,S2,3,2001-02-03,\n',
+            'siti@example.com,Siti Aminah,P200,2222,F,married,S1,,,siti_custom\n',
+            ',,P300,3333,M,single,S1,1,,\n',
+        ])
+        output = self.run_import(path, batch_size=2)
+        self.assertIn('Row 1: Created student for user ali', output)
+        self.assertIn('Row 2: Created student for user siti_custom', output)
+        self.assertIn('Row 3: missing username and email', output)
+        self.assertEqual(Student.objects.count(), 2)
+        ali = Student.objects.get(user__username='ali')
+        self.assertEqual(ali.full_name, 'Ali Akbar')
+        self.assertEqual(ali.degree_level, 'S2')
+        self.assertEqual(str(ali.birth_date), '2001-02-03')
+        self.assertFalse(ali.user.has_usable_password())
+
+    def test_bulk_update_overwrites_existing_students(self):
+        path = self.write_csv(['ali@example.com,Ali Akbar,P100,1111,M,single,S2,3,,\n'])
+        self.run_import(path)
+        path = self.write_csv(['ali@example.com,Ali Akbar,P100,1111,M,single,S3,5,,\n'])
+        output = self.run_import(path)
+        self.assertIn('Student already exists for user ali (skipped)', output)
+        output = self.run_import(path, update=True)
+        self.assertIn('Row 1: Updated student for user ali', output)
+        ali = Student.objects.get(user__username='ali')
+        self.assertEqual((ali.degree_level, ali.semester_level), ('S3', 5))
+
+    def test_bulk_update_rejects_nik_of_another_users_student(self):
+        path = self.write_csv(['ali@example.com,Ali Akbar,P100,1111,M,single,S2,3,,\n'])
+        self.run_import(path)
+        path = self.write_csv([
+            'ali@example.com,Ali Akbar,P100,1111,M,single,S2,3,,\n',
+            'budi@example.com,Budi Santoso,P200,1111,M,single,S1,1,,\n',
+        ])
+        output = self.run_import(path, update=True)
+        self.assertIn("Row 2: student validation error: {'nik':", output)
+        ali = Student.objects.get(user__username='ali')
+        self.assertEqual((ali.passport_number, ali.nik), ('P100', '1111'))
+        self.assertFalse(Student.objects.filter(user__username='budi').exists())
+
+    def test_import_writes_profile_detail_fields(self):
+        header = 'email,full_name,gender,marital_status,sport_interest,organization_history\n'
+        path = self.write_csv(['ali@example.com,Ali Akbar,M,single,Bola,PPMI\n', 'budi@example.com,Budi,M,single,,\n'],
+                              header)
+        self.run_import(path)
+        self.assertEqual(list(StudentProfileDetail.objects.values_list('student__user__username', 'sport_interest',
+                                                                       'organization_history')),
+                         [('ali', 'Bola', 'PPMI')])
+        # an empty cell keeps the stored value
+        path = self.write_csv(['ali@example.com,Ali Akbar,M,single,Renang,\n', 'budi@example.com,Budi,M,single,Catur,\n'],
+                              header)
+        self.run_import(path, update=True)
+        self.assertEqual(sorted(StudentProfileDetail.objects.values_list('student__user__username', 'sport_interest',
+                                                                         'organization_history')),
+                         [('ali', 'Renang', 'PPMI'), ('budi', 'Catur', '')])
+
+    def test_resume_continues_after_last_checkpoint(self):
+        path = self.write_csv([
+            'a@example.com,Anis A,P1,11,M,single,S1,1,,\n',
+            'b@example.com,Badr B,P2,22,M,single,S1,1,,\n',
+            ',,P3,33,M,single,S1,1,,\n',
+            'c@example.com,Cici C,P4,44,F,single,S1,1,,\n',
+        ])
+        original = BulkStudentImporter.import_chunk
+        calls = []
+
+        def crash_on_second_chunk(importer, chunk):
+            calls.append(chunk)
+            if len(calls) == 2:
+                raise RuntimeError('simulated crash')
+            return original(importer, chunk)
+
+        with mock.patch.object(BulkStudentImporter, 'import_chunk', crash_on_second_chunk):
+            with self.assertRaises(RuntimeError):
+                self.run_import(path, batch_size=2)
+        self.assertTrue(os.path.exists(path + '.checkpoint'))
+        self.assertEqual(Student.objects.count(), 2)
+
+        output = self.run_import(path, batch_size=2, resume=True)
+        self.assertIn('Resuming after row 2', output)
+        self.assertIn('Students created: 3', output)
+        self.assertEqual(Student.objects.count(), 3)
+        self.assertFalse(os.path.exists(path + '.checkpoint'))
+        with open(path[:-4] + '.rejects.csv', encoding='utf-8') as f:
+            rejects = f.read().splitlines()
+        self.assertEqual(len(rejects), 2)
+        self.assertTrue(rejects[1].startswith('3,missing username and email'))
+
+    def test_parallel_parsing_keeps_file_order(self):
+        rows = ['s%d@example.com,Student %d,P%d,%d,M,single,S1,1,,\n' % (i, i, i, i) for i in range(1, 8)]
+        rows.insert(3, 'bad@example.com,Bad Row,P99,99,M,single,S1,99,,\n')
+        path = self.write_csv(rows)
+        output = self.run_import(path, batch_size=2, workers=2)
+        messages = [line for line in output.splitlines() if line.startswith('Row ')]
+        self.assertEqual([int(line.split(':')[0][4:]) for line in messages], [1, 2, 3, 5, 6, 7, 8])
+        self.assertIn('Row 4: student validation error', output)
+        self.assertEqual(Student.objects.count(), 7)
+
+    def test_row_import_bumps_data_version_and_count_once(self):
+        recount_students()
+        before = DataVersion.objects.get(name='students').number
+        path = self.write_csv([
+            'ali@example.com,Ali Akbar,P100,1111,M,single,S2,3,,\n',
+            'siti@example.com,Siti Aminah,P200,2222,F,married,S1,1,,\n',
+        ])
+        call_command('seed_students_from_csv', csv=path, stdout=StringIO())
+        version = DataVersion.objects.get(name='students')
+        self.assertEqual((version.number, version.row_count), (before + 1, Student.objects.count()))
+
+    def test_invalid_student_fields_still_write_the_user(self):
+        path = self.write_csv(['bad@example.com,Bad Row,P99,99,M,single,S1,99,,\n'])
+        output = self.run_import(path)
+        self.assertIn("Row 1: student validation error: {'semester_level':", output)
+        self.assertIn('Users created: 1', output)
+        bad = get_user_model().objects.get(username='bad')
+        self.assertEqual((bad.first_name, bad.last_name), ('Bad', 'Row'))
+        self.assertFalse(Student.objects.filter(user=bad).exists())
+
+    def test_invalid_row_of_an_existing_student_is_skipped_without_update(self):
+        self.run_import(self.write_csv(['ali@example.com,Ali Akbar,P100,1111,M,single,S2,3,,\n']))
+        path = self.write_csv(['ali@example.com,Ali Akbar,P100,1111,M,single,S2,99,,\n'])
+        options = [{'bulk': False}, {}, *([{'copy': True}] if connection.vendor == 'postgresql' else [])]
+        for mode in options:
+            with self.subTest(**mode):
+                output = self.run_import(path, **mode)
+                self.assertNotIn('validation error', output)
+                self.assertNotIn('Errors (', output)
+                self.assertIn('skipped: 1', output)
+        output = self.run_import(path, update=True)
+        self.assertIn("Row 1: student validation error: {'semester_level':", output)
+        self.assertEqual(Student.objects.get(user__username='ali').semester_level, 3)
+
+    def test_row_with_invalid_student_and_user_is_reported_once(self):
+        # the username is too long for auth_user (PostgreSQL enforces it, the dry run checks it)
+        path = self.write_csv([f'bad@example.com,Bad Row,P99,99,M,single,S1,99,,{"b" * 200}\n'])
+        report_path = path[:-4] + '.dry-run.csv'
+        self.addCleanup(lambda: os.path.exists(report_path) and os.unlink(report_path))
+        for options in ({'dry_run': True}, {}):
+            with self.subTest(**options):
+                output = self.run_import(path, **options)
+                self.assertIn('Errors (1):', output)
+                self.assertIn("Row 1: student validation error: {'semester_level':", output)
+                self.assertNotIn('user create error', output)
+
+    def test_column_plan_infers_one_date_format_per_column(self):
+        source_rows = [
+            ['Email', 'BIRTH_DATE', 'semester_level', 'email', 'notes'],
+            ['a@example.com', '01/02/2004', '3', 'other@example.com', 'x'],
+            ['b@example.com', '10/13/2004', '', '', ''],
+        ]
+        plan = ColumnPlan(source_rows[0], source_rows[1:])
+        self.assertIn("[1] 'BIRTH_DATE' -> Student.birth_date (date %m/%d/%Y)", plan.explain())
+        self.assertIn("[3] 'email': ignored (duplicate header)", plan.explain())
+        username, email, full_name, defaults = plan.parse(source_rows[1])
+        self.assertEqual((username, email, full_name), ('a', 'a@example.com', None))
+        self.assertEqual(str(defaults['birth_date']), '2004-01-02')
+        self.assertEqual(defaults['semester_level'], 3)
+        # values that do not fit the inferred format are still parsed individually
+        self.assertEqual(str(plan.parse(['c@example.com', '2004-05-06'])[3]['birth_date']), '2004-05-06')
+
+    def test_files_with_the_same_header_get_their_own_date_format(self):
+        self.run_import(self.write_csv([
+            'ali@example.com,Ali Akbar,P100,1111,M,single,S2,3,01/14/2004,\n',
+            'budi@example.com,Budi Santoso,P200,2222,M,single,S2,3,02/03/2004,\n',
+        ]))
+        self.run_import(self.write_csv([
+            'cici@example.com,Cici Paramida,P300,3333,F,single,S2,3,13/01/2004,\n',
+            'dedi@example.com,Dedi Kurniawan,P400,4444,M,single,S2,3,02/03/2004,\n',
+        ]))
+        self.assertEqual(dict(Student.objects.values_list('user__username', 'birth_date')), {
+            'ali': date(2004, 1, 14), 'budi': date(2004, 2, 3), 'cici': date(2004, 1, 13), 'dedi': date(2004, 3, 2)})
+
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+    def test_issue_credentials_sets_passwords_for_imported_users(self):
+        path = self.write_csv([
+            'ali@example.com,Ali Akbar,P100,1111,M,single,S2,3,,\n',
+            ',Siti Aminah,P200,2222,F,married,S1,,,siti\n',
+        ])
+        self.run_import(path)
+        output_path = path[:-4] + '.credentials.csv'
+        self.addCleanup(os.unlink, output_path)
+        call_command('issue_credentials', email=True, output=output_path, workers=1, stdout=StringIO())
+
+        with open(output_path, encoding='utf-8') as f:
+            credentials = {row[0]: row[2] for row in csv.reader(f)}
+        User = get_user_model()
+        self.assertTrue(User.objects.get(username='ali').check_password(credentials['ali']))
+        self.assertTrue(User.objects.get(username='siti').check_password(credentials['siti']))
+        self.assertEqual([message.to for message in mail.outbox], [['ali@example.com']])
+        self.assertIn(credentials['ali'], mail.outbox[0].body)
+
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+    def test_issue_credentials_keeps_passwords_unset_when_the_email_fails(self):
+        self.run_import(self.write_csv([
+            'ali@example.com,Ali Akbar,P100,1111,M,single,S2,3,,\n',
+            'siti@example.com,Siti Aminah,P200,2222,F,married,S1,,,\n',
+        ]))
+        send_messages = locmem.EmailBackend.send_messages
+
+        def refuse_siti(backend, messages):
+            if messages[0].to == ['siti@example.com']:
+                raise smtplib.SMTPRecipientsRefused({'siti@example.com': (550, b'No such user')})
+            return send_messages(backend, messages)
+
+        with mock.patch.object(locmem.EmailBackend, 'send_messages', refuse_siti), \
+                self.assertRaisesMessage(CommandError, 'Could not email 1 users: siti.'):
+            call_command('issue_credentials', email=True, workers=1, stdout=StringIO(), stderr=StringIO())
+        User = get_user_model()
+        self.assertTrue(User.objects.get(username='ali').has_usable_password())
+        self.assertFalse(User.objects.get(username='siti').has_usable_password())
+
+        # the next run issues the password of the user whose email failed, and only theirs
+        call_command('issue_credentials', email=True, workers=1, stdout=StringIO())
+        self.assertEqual([message.to for message in mail.outbox], [['ali@example.com'], ['siti@example.com']])
+        password = mail.outbox[1].body.split('Password: ')[1].split()[0]
+        self.assertTrue(User.objects.get(username='siti').check_password(password))
+
+    def test_copy_falls_back_to_bulk_without_postgres(self):
+        path = self.write_csv(['ali@example.com,Ali Akbar,P100,1111,M,single,S2,3,,\n'])
+        with mock.patch('data_management.utils.student_import_pg.CopyStudentImporter.supported', return_value=False):
+            output = self.run_import(path, copy=True)
+        self.assertIn('--copy needs PostgreSQL', output)
+        self.assertIn('Row 1: Created student for user ali', output)
+
+    @skipUnless(connection.vendor == 'postgresql', 'COPY merge needs PostgreSQL')
+    def test_copy_merges_chunk_and_reports_conflicts(self):
+        path = self.write_csv(['ali@example.com,Ali Akbar,P100,1111,M,single,S2,3,,\n'])
+        self.run_import(path)
+        path = self.write_csv([
+            'ali@example.com,Ali Akbar,P100,1111,M,single,S3,5,,\n',
+            'budi@example.com,Budi Santoso,P200,2222,M,single,S1,1,,\n',
+            'cici@example.com,Cici Paramida,P200,3333,F,single,S1,1,,\n',
+            'dedi@example.com,Dedi Kurniawan,P400,1111,M,single,S1,1,,\n',
+        ])
+        output = self.run_import(path, copy=True, update=True)
+        self.assertIn('Rows 1-4: 1 created, 1 updated, 0 skipped, 2 conflicting', output)
+        self.assertIn("Row 3: student validation error: {'passport_number':", output)
+        self.assertIn("Row 4: student validation error: {'nik':", output)
+        self.assertEqual(Student.objects.get(user__username='ali').semester_level, 5)
+        self.assertFalse(Student.objects.filter(user__username__in=['cici', 'dedi']).exists())
+        self.assertFalse(Student.objects.get(user__username='budi').user.has_usable_password())
+
+    def test_reimport_skips_rows_unchanged_since_last_import(self):
+        path = self.write_csv([
+            'ali@example.com,Ali Akbar,P100,1111,M,single,S2,3,,\n',
+            'siti@example.com,Siti Aminah,P200,2222,F,married,S1,1,,\n',
+        ])
+        self.run_import(path, update=True)
+        with mock.patch('data_management.utils.student_import.Student.full_clean') as full_clean:
+            output = self.run_import(path, update=True)
+        full_clean.assert_not_called()
+        self.assertIn('Rows unchanged since the last import (skipped): 2, changed: 0', output)
+
+        # an edit made outside the importer makes the next import rewrite that row
+        siti = Student.objects.get(user__username='siti')
+        siti.semester_level = 7
+        siti.save()
+        output = self.run_import(path, update=True)
+        self.assertIn('Row 2: Updated student for user siti', output)
+        self.assertIn('Rows unchanged since the last import (skipped): 1, changed: 1', output)
+        self.assertEqual(Student.objects.get(user__username='siti').semester_level, 1)
+
+    def test_quiet_import_writes_json_report(self):
+        path = self.write_csv([
+            'ali@example.com,Ali Akbar,P100,1111,M,single,S2,3,,\n',
+            ',,P300,3333,M,single,S1,1,,\n',
+        ])
+        report_path = path + '.report.json'
+        self.addCleanup(lambda: os.path.exists(report_path) and os.unlink(report_path))
+        output = self.run_import(path, quiet=True, report=report_path)
+        self.assertNotIn('Row 1: Created student', output)
+        self.assertIn('Processed 2 rows in', output)
+        with open(report_path, encoding='utf-8') as f:
+            report = json.load(f)
+        self.assertEqual(report['rows'], 2)
+        self.assertEqual(set(report['stages_s']), {'read', 'parse', 'lookup', 'validate', 'write'})
+        self.assertGreater(report['db']['queries'], 0)
+        self.assertEqual(report['totals']['created_students'], 1)
+        self.assertEqual(len(report['slowest_rows']), 2)
+
+    def test_dry_run_reports_every_problem_and_writes_nothing(self):
+        self.run_import(self.write_csv([
+            'ali@example.com,Ali Akbar,P100,1111,M,single,S2,3,,\n',
+            'siti@example.com,Siti Aminah,P200,2222,F,married,S1,1,,\n',
+        ]))
+        path = self.write_csv([
+            'ali@example.com,Ali Akbar,P100,1111,M,single,S2,4,,\n',
+            # passport belongs to ali, NIK to siti
+            'budi@example.com,Budi,P100,2222,M,single,S1,1,,\n',
+            'eko@example.com,Eko,P500,5555,M,single,S1,99,,\n',
+            'dewi@example.com,Dewi,P400,4444,F,single,S1,1,,\n',
+        ])
+        report_path = path[:-4] + '.json'
+        self.addCleanup(lambda: os.path.exists(report_path) and os.unlink(report_path))
+        output = self.run_import(path, update=True, dry_run=True, rejects=report_path)
+
+        self.assertEqual(Student.objects.count(), 2)
+        self.assertEqual(Student.objects.get(user__username='ali').semester_level, 3)
+        self.assertFalse(get_user_model().objects.filter(username__in=['budi', 'dewi']).exists())
+        self.assertIn('Row 4: Would create student for user dewi', output)
+        self.assertIn('Users created: 3, updated: 0', output)
+        self.assertIn('Students created: 1, updated: 1, skipped: 2', output)
+        with open(report_path, encoding='utf-8') as f:
+            report = json.load(f)
+        self.assertEqual(sorted((entry['row'], entry['column'], entry['value']) for entry in report),
+                         [(2, 'nik', '2222'), (2, 'passport_number', 'P100'), (3, 'semester_level', '99')])
+        self.assertIn('3 problems in 2 rows', output)
+
+    def test_import_refuses_to_run_while_another_command_holds_the_lock(self):
+        path = self.write_csv(['ali@example.com,Ali Akbar,P100,1111,M,single,S2,3,,\n'])
+        now = timezone.now()
+        CommandLock.objects.create(name='student-data', token='x', command='issue_credentials', host='node-2',
+                                   pid=42, acquired_at=now, renewed_at=now, expires_at=now + timedelta(minutes=1))
+        with self.assertRaisesMessage(CommandError, 'issue_credentials is already running on node-2 (pid 42)'):
+            self.run_import(path)
+        self.assertFalse(Student.objects.exists())
+        out = StringIO()
+        call_command('lock_status', stdout=out)
+        self.assertIn('student-data: issue_credentials on node-2 (pid 42)', out.getvalue())
+
+        # the holder died: once its lease expires the next run takes over, then releases the lock
+        CommandLock.objects.update(expires_at=now - timedelta(seconds=1))
+        output = self.run_import(path)
+        self.assertIn('Took over the expired lock', output)
+        self.assertEqual(Student.objects.count(), 1)
+        self.assertFalse(CommandLock.objects.exists())
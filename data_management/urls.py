@@ -17,9 +17,15 @@ urlpatterns = [
     path("dashboard/profile/", views.StudentDataDetailView.as_view(), name='profile'),
     path("dashboard/profile/edit/", views.StudentDataUpdateView.as_view(), name='profile_edit'),
     path('dashboard/staff/students/', views.StaffDashboardDataListView.as_view(), name='staff_student_list'),
+    path('dashboard/staff/students/suggest/', views.student_suggest, name='staff_student_suggest'),
     path('dashboard/staff/students/add/', views.StaffStudentCreateView.as_view(), name='staff_student_create'),
     path('dashboard/staff/students/<uuid:pk>/', views.StaffStudentDetailView.as_view(), name='staff_student_detail'),
-    path('dashboard/staff/students/export/csv/', views.export_students_csv, name='export_students_csv'),
+    path('dashboard/staff/students/export/', views.export_students, name='export_students'),
+    path('dashboard/staff/students/export/csv/', views.export_students, name='export_students_csv'),
+    path('dashboard/staff/students/export/jobs/', views.export_job_create, name='export_job_create'),
+    path('dashboard/staff/students/export/jobs/<uuid:pk>/', views.export_job_status, name='export_job_status'),
+    path('dashboard/staff/students/export/jobs/<uuid:pk>/download/', views.export_job_download,
+         name='export_job_download'),
     path('dashboard/staff/students/<uuid:pk>/edit/', views.StaffStudentUpdateView.as_view(), name='staff_student_edit'),
     path('dashboard/staff/students/<uuid:pk>/reset-password/', views.staff_student_reset_password,
          name='staff_student_reset_password'),
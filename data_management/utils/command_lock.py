@@ -0,0 +1,143 @@
+"""
+Single-runner lock for long-running management commands.
+
+Commands that write student data take a lease on one ``CommandLock`` row
+(``student-data`` by default), so two nodes cannot import into the same
+database at once. The row is the lock: creating it acquires the lease, a
+background thread pushes ``expires_at`` forward every third of the lease,
+and deleting it releases the lease. A holder that died without releasing
+stops renewing, and once its lease has expired the next command takes
+the row over. ``lock_status`` shows the current holders.
+
+The lock lives in the database rather than the cache because the
+configured caches are per process (LocMemCache) and would not be seen by
+other nodes.
+"""
+import logging
+import os
+import socket
+import threading
+import uuid
+from datetime import timedelta
+from functools import wraps
+
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from data_management.models import CommandLock
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOCK = 'student-data'
+LEASE_SECONDS = 60
+
+
+class LockUnavailable(Exception):
+    """Another command holds the lock; ``holder`` is its ``CommandLock`` row (None if it just went away)."""
+
+    def __init__(self, name, holder):
+        self.name = name
+        self.holder = holder
+        super().__init__(f'lock {name!r} is held by {holder}' if holder else f'lock {name!r} is busy')
+
+
+class LockLost(Exception):
+    """The lease expired or was taken over while the command was still running."""
+
+
+class Lease:
+    def __init__(self, command, name=DEFAULT_LOCK, seconds=LEASE_SECONDS):
+        self.command = command
+        self.name = name
+        self.seconds = seconds
+        self.token = uuid.uuid4().hex
+        self.lost = False
+        self.took_over = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def acquire(self):
+        now = timezone.now()
+        fields = {'token': self.token, 'command': self.command, 'host': socket.gethostname(), 'pid': os.getpid(),
+                  'acquired_at': now, 'renewed_at': now, 'expires_at': now + timedelta(seconds=self.seconds)}
+        try:
+            with transaction.atomic():
+                CommandLock.objects.create(name=self.name, **fields)
+        except IntegrityError:
+            # held, or left behind by a process that died: only an expired lease can be taken over
+            stale = CommandLock.objects.filter(name=self.name, expires_at__lt=now).first()
+            if stale is None or not CommandLock.objects.filter(
+                    name=self.name, token=stale.token, expires_at__lt=now).update(**fields):
+                raise LockUnavailable(self.name, CommandLock.objects.filter(name=self.name).first())
+            self.took_over = stale
+            logger.warning(f'Took over stale lock {self.name!r} from {stale} (expired {stale.expires_at})')
+        self._thread = threading.Thread(target=self._keep_alive, name=f'lease-{self.name}', daemon=True)
+        self._thread.start()
+        return self
+
+    def renew(self):
+        now = timezone.now()
+        renewed = CommandLock.objects.filter(name=self.name, token=self.token).update(
+            renewed_at=now, expires_at=now + timedelta(seconds=self.seconds))
+        if not renewed:
+            self.lost = True
+            logger.error(f'Lock {self.name!r} was lost by {self.command} (pid {os.getpid()})')
+
+    def _keep_alive(self):
+        try:
+            while not self._stop.wait(self.seconds / 3) and not self.lost:
+                try:
+                    self.renew()
+                except Exception:
+                    logger.exception(f'Could not renew lock {self.name!r}; retrying')
+        finally:
+            connection.close()
+
+    def check(self):
+        """Raise ``LockLost`` if another command may be running now; call between units of work."""
+        if self.lost:
+            raise LockLost(f'lock {self.name!r} was lost; another command may have taken over')
+
+    def release(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        CommandLock.objects.filter(name=self.name, token=self.token).delete()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+def exclusive_command(name=DEFAULT_LOCK, seconds=LEASE_SECONDS):
+    """
+    Decorator for ``Command.handle``: run it while holding lease ``name``.
+
+    The lease is available as ``self.lease`` (for ``check()`` between
+    batches); failures to acquire or a lost lease become ``CommandError``.
+    """
+    def decorator(handle):
+        @wraps(handle)
+        def wrapper(self, *args, **options):
+            command = self.__module__.rsplit('.', 1)[-1]
+            try:
+                with Lease(command, name, seconds) as self.lease:
+                    if self.lease.took_over:
+                        self.stdout.write(self.style.WARNING(
+                            f'Took over the expired lock of {self.lease.took_over}'))
+                    return handle(self, *args, **options)
+            except LockUnavailable as e:
+                holder = e.holder
+                if holder is None:
+                    raise CommandError(f'{e}; try again')
+                raise CommandError(
+                    f'{holder.command} is already running on {holder.host} (pid {holder.pid}) since '
+                    f'{timezone.localtime(holder.acquired_at):%Y-%m-%d %H:%M:%S}. '
+                    f'See `manage.py lock_status`.')
+            except LockLost as e:
+                raise CommandError(str(e))
+        return wrapper
+    return decorator
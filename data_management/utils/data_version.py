@@ -0,0 +1,48 @@
+"""
+Version of the student data.
+
+Saves and deletes of students and users (signals) and imports
+(``seed_students_from_csv``) call ``student_data_changed()``, which bumps
+one counter row. Anything derived from student data, like the cached
+export files, is keyed by the current version, so a change makes the
+old entries unreachable instead of having to find and invalidate them.
+The counter lives in the database because every gunicorn worker has its
+own local-memory cache.
+"""
+from collections import namedtuple
+
+from django.db.models import F
+from django.utils import timezone
+
+from data_management.models import DataVersion
+from data_management.utils.export_jobs import mark_exports_stale
+
+STUDENTS = 'students'
+
+Version = namedtuple('Version', 'number changed_at')
+
+
+def version_tag(version):
+    """Short string naming ``version``; includes the time so it stays unique if the counter is ever reset."""
+    return f'{version.number}.{int(version.changed_at.timestamp())}'
+
+
+def current_version(name=STUDENTS):
+    row = DataVersion.objects.filter(name=name).values_list('number', 'changed_at').first()
+    if row is None:
+        row = DataVersion.objects.get_or_create(name=name)[0]
+        return Version(row.number, row.changed_at)
+    return Version(*row)
+
+
+def bump_version(name=STUDENTS):
+    now = timezone.now()
+    bumped = DataVersion.objects.filter(name=name).update(number=F('number') + 1, changed_at=now)
+    if not bumped and not DataVersion.objects.get_or_create(name=name, defaults={'number': 1, 'changed_at': now})[1]:
+        # created by someone else in the meantime
+        DataVersion.objects.filter(name=name).update(number=F('number') + 1, changed_at=now)
+
+
+def student_data_changed():
+    bump_version()
+    mark_exports_stale()
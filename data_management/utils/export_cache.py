@@ -0,0 +1,79 @@
+"""
+Cached student export files.
+
+An export depends only on its filters, column set and format and on the
+student data, so the first download of each combination is written to
+the private ``exports`` storage under ``cache/`` (see ``export_storage``)
+while it streams to the client. Later downloads are served from that
+file, by ``export_students`` only, until ``data_version`` moves on. File names end with the version tag, and
+writing a file for a new version deletes those of older versions.
+
+``export_etag()`` gives the same identity as an HTTP ETag, so a browser
+or script that already has the file gets a 304 without any query on the
+student table.
+"""
+import logging
+import os
+import tempfile
+
+from django.core.files import File
+
+from data_management.utils.data_version import current_version, version_tag
+from data_management.utils.export_jobs import export_key, export_params
+from data_management.utils.export_storage import export_storage
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = 'cache'
+
+
+def export_cache_key(params, columns, format_name):
+    return export_key(export_params(params), [columns, format_name])
+
+
+def export_etag(params, columns, format_name, version):
+    return f'"{export_cache_key(params, columns, format_name)}-{version_tag(version)}"'
+
+
+def cached_export_name(params, columns, format_name, extension, version):
+    return f'{CACHE_DIR}/{export_cache_key(params, columns, format_name)}-{version_tag(version)}.{extension}'
+
+
+def open_cached_export(name):
+    """The cached file ``name`` opened for reading, or None if it was not written yet."""
+    if not export_storage.exists(name):
+        return None
+    return export_storage.open(name, 'rb')
+
+
+def caching(chunks, name, version):
+    """Yield ``chunks`` unchanged and, once all of them were sent, store them as the cached file ``name``.
+
+    Nothing is stored if the client goes away before the end.
+    """
+    handle, path = tempfile.mkstemp()
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk.encode() if isinstance(chunk, str) else chunk)
+                yield chunk
+        # data changed while streaming: the file may already be out of date
+        if current_version() == version and not export_storage.exists(name):
+            with open(path, 'rb') as f:
+                export_storage.save(name, File(f))
+            prune(version)
+    finally:
+        os.remove(path)
+
+
+def prune(version):
+    """Delete the cached files of every data version but ``version``."""
+    current = f'-{version_tag(version)}.'
+    try:
+        names = export_storage.listdir(CACHE_DIR)[1]
+    except FileNotFoundError:
+        return
+    for name in names:
+        if current not in name:
+            export_storage.delete(f'{CACHE_DIR}/{name}')
+            logger.debug(f'Deleted outdated export {name}')
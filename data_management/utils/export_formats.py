@@ -0,0 +1,254 @@
+"""
+File formats for student exports.
+
+Every writer takes the rows of ``student_export.export_rows()`` and the
+column spec, and yields the file in pieces for a
+``StreamingHttpResponse``; none of them holds more than one batch of
+rows. Writers for binary formats write into a ``ChunkSink`` and hand out
+whatever has accumulated every ``FLUSH_BYTES``.
+
+- ``csv``: text, one value per cell, as before.
+- ``xlsx``: a minimal SpreadsheetML workbook written straight into a
+  zip stream (dates, numbers and booleans keep their cell types).
+- ``ndjson``: gzip-compressed JSON lines; dates are ISO strings and
+  decimals are JSON numbers (at most 10 digits, so they read back exactly).
+- ``parquet`` / ``arrow``: record batches with a schema derived from the
+  model fields (``decimal128`` for money and grades, ``date32``,
+  dictionary-encoded choice codes). Needs the optional ``pyarrow``
+  package; without it these formats are not offered.
+"""
+import datetime
+import gzip
+import io
+import json
+import re
+import zipfile
+from collections import namedtuple
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.db import models
+
+from data_management.utils.student_export import column_fields, export_header, stream_csv
+from data_management.utils.student_import import chunked
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # optional: only needed for the parquet/arrow formats
+    pyarrow = None
+
+FLUSH_BYTES = 256 * 1024
+BATCH_ROWS = 5000
+
+
+class ChunkSink(io.RawIOBase):
+    """Write-only, non-seekable file that buffers output until ``drain()`` is called."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self.size = 0
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self.size += len(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        self.size = 0
+        return data
+
+
+def csv_writer(rows, columns):
+    yield from stream_csv(rows, export_header(columns))
+
+
+# ----------------------------------------------------------------------------
+# XLSX
+# ----------------------------------------------------------------------------
+
+XLSX_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+XLSX_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        f'<Relationship Id="rId1" Type="{XLSX_REL}/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<workbook xmlns="{XLSX_NS}" xmlns:r="{XLSX_REL}">'
+        '<sheets><sheet name="Students" sheetId="1" r:id="rId1"/></sheets></workbook>'),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        f'<Relationship Id="rId1" Type="{XLSX_REL}/worksheet" Target="worksheets/sheet1.xml"/>'
+        f'<Relationship Id="rId2" Type="{XLSX_REL}/styles" Target="styles.xml"/>'
+        '</Relationships>'),
+    # cell styles: 0 default, 1 date, 2 bold header
+    'xl/styles.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<styleSheet xmlns="{XLSX_NS}">'
+        '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+        '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+        '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+        '</styleSheet>'),
+}
+EXCEL_EPOCH = datetime.date(1899, 12, 30)
+# characters XML 1.0 does not allow, even escaped
+XML_ILLEGAL = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def xlsx_cell(value, style=0):
+    if value is None or value == '':
+        return '<c/>'
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float, Decimal)):
+        return f'<c><v>{value}</v></c>'
+    if isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+        return f'<c s="1"><v>{(value - EXCEL_EPOCH).days}</v></c>'
+    text = escape(XML_ILLEGAL.sub('', str(value)))
+    style_attribute = f' s="{style}"' if style else ''
+    return f'<c t="inlineStr"{style_attribute}><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def xlsx_writer(rows, columns):
+    sink = ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_PARTS.items():
+            archive.writestr(name, content)
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            header = ''.join(xlsx_cell(name, style=2) for name in export_header(columns))
+            sheet.write(f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><worksheet xmlns="{XLSX_NS}">'
+                        f'<sheetData><row>{header}</row>'.encode())
+            for row in rows:
+                sheet.write(f'<row>{"".join(xlsx_cell(value) for value in row)}</row>'.encode())
+                if sink.size >= FLUSH_BYTES:
+                    yield sink.drain()
+            sheet.write(b'</sheetData></worksheet>')
+    yield sink.drain()
+
+
+# ----------------------------------------------------------------------------
+# NDJSON
+# ----------------------------------------------------------------------------
+
+def json_value(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def ndjson_writer(rows, columns):
+    sink = ChunkSink()
+    header = export_header(columns)
+    with gzip.GzipFile(fileobj=sink, mode='wb') as archive:
+        for row in rows:
+            archive.write(json.dumps(dict(zip(header, row)), default=json_value, ensure_ascii=False).encode())
+            archive.write(b'\n')
+            if sink.size >= FLUSH_BYTES:
+                yield sink.drain()
+    yield sink.drain()
+
+
+# ----------------------------------------------------------------------------
+# Parquet / Arrow IPC
+# ----------------------------------------------------------------------------
+
+def arrow_type(field, converted=False):
+    if converted or isinstance(field, models.UUIDField):
+        return pyarrow.string()
+    if isinstance(field, models.BooleanField):
+        return pyarrow.bool_()
+    if isinstance(field, models.DecimalField):
+        return pyarrow.decimal128(field.max_digits, field.decimal_places)
+    if isinstance(field, models.DateTimeField):
+        return pyarrow.timestamp('us', tz='UTC')
+    if isinstance(field, models.DateField):
+        return pyarrow.date32()
+    if isinstance(field, models.SmallIntegerField):
+        return pyarrow.int16()
+    if isinstance(field, models.IntegerField):
+        return pyarrow.int64()
+    if field.choices:
+        return pyarrow.dictionary(pyarrow.int32(), pyarrow.string())
+    return pyarrow.string()
+
+
+def arrow_schema(columns):
+    return pyarrow.schema([
+        pyarrow.field(header, arrow_type(field, converted=convert is not None), nullable=True)
+        for (header, lookup, convert), field in zip(columns, column_fields(columns))
+    ])
+
+
+def record_batches(rows, schema):
+    """Turn ``rows`` into record batches of ``BATCH_ROWS`` rows each."""
+    for batch in chunked(rows, BATCH_ROWS):
+        yield pyarrow.RecordBatch.from_arrays(
+            [pyarrow.array(values, type=field.type) for values, field in zip(zip(*batch), schema)], schema=schema)
+
+
+def arrow_file_writer(open_writer):
+    def writer(rows, columns):
+        sink = ChunkSink()
+        schema = arrow_schema(columns)
+        with open_writer(sink, schema) as out:
+            for batch in record_batches(rows, schema):
+                out.write_batch(batch)
+                yield sink.drain()
+        yield sink.drain()
+    return writer
+
+
+parquet_writer = arrow_file_writer(lambda sink, schema: pyarrow.parquet.ParquetWriter(sink, schema))
+arrow_writer = arrow_file_writer(lambda sink, schema: pyarrow.ipc.new_stream(sink, schema))
+
+
+ExportFormat = namedtuple('ExportFormat', 'content_type extension writer needs_pyarrow')
+FORMATS = {
+    'csv': ExportFormat('text/csv', 'csv', csv_writer, False),
+    'xlsx': ExportFormat('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx',
+                         xlsx_writer, False),
+    'ndjson': ExportFormat('application/gzip', 'ndjson.gz', ndjson_writer, False),
+    'parquet': ExportFormat('application/vnd.apache.parquet', 'parquet', parquet_writer, True),
+    'arrow': ExportFormat('application/vnd.apache.arrow.stream', 'arrows', arrow_writer, True),
+}
+
+
+def available_formats():
+    return [name for name, export_format in FORMATS.items() if pyarrow is not None or not export_format.needs_pyarrow]
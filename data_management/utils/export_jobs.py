@@ -0,0 +1,134 @@
+"""
+Background student exports.
+
+Large exports (every column of every student) take longer than a
+gunicorn sync worker may spend on a request, so ``enqueue_export()``
+records an ``ExportJob`` and writes the file on a daemon thread of the
+worker that received the request. The thread reports progress and a
+heartbeat on the job row, which the dashboard polls through HTMX, and
+stores the finished file in the private ``exports`` storage (see
+``export_storage``), from where ``export_job_download`` serves it.
+
+A finished job is reused for the same filters and columns until student
+data changes: ``data_version.student_data_changed()`` (called on saves,
+deletes and imports) flags every existing export as stale.
+If a worker is recycled mid-export its job stops heartbeating, and the
+next status poll restarts it.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from datetime import timedelta
+
+from django.core.files import File
+from django.db import connection
+from django.utils import timezone
+
+from data_management.models import ExportJob, Student
+from data_management.utils.student_export import COLUMN_SETS, export_header, export_rows, stream_csv
+from data_management.utils.student_query import (
+    DEFAULT_ORDERING, filter_query, filter_students, sort_query, sort_students,
+)
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_EVERY = 1000
+ABANDONED_AFTER = timedelta(seconds=60)
+
+
+def export_params(params):
+    """The parts of ``params`` (e.g. ``request.GET``) that select and order the exported rows."""
+    return {**filter_query(params), **sort_query(params)}
+
+
+def export_key(params, columns):
+    return hashlib.sha1(json.dumps([params, columns], sort_keys=True).encode()).hexdigest()
+
+
+def mark_exports_stale():
+    """Student data changed: no existing export may be handed out again."""
+    ExportJob.objects.filter(stale=False).update(stale=True)
+
+
+def enqueue_export(params, columns='all', user=None):
+    """Return the job exporting ``params``/``columns``: a reusable one, or a new one that is started now."""
+    params = export_params(params)
+    key = export_key(params, columns)
+    job = (ExportJob.objects.filter(key=key, stale=False).exclude(status=ExportJob.FAILED)
+           .order_by('-created_at').first())
+    if job is not None:
+        return job
+    for old in ExportJob.objects.filter(key=key).exclude(status__in=[ExportJob.QUEUED, ExportJob.RUNNING]):
+        old.file.delete(save=False)
+        old.delete()
+    job = ExportJob.objects.create(key=key, params=params, columns=columns, requested_by=user)
+    start_job(job.pk)
+    return job
+
+
+def start_job(job_id):
+    threading.Thread(target=_run_in_thread, args=(job_id,), name=f'export-{job_id}', daemon=True).start()
+
+
+def _run_in_thread(job_id):
+    try:
+        run_export_job(job_id)
+    finally:
+        connection.close()
+
+
+def resume_if_abandoned(job):
+    """Restart ``job`` if the thread writing it went away (e.g. the worker was recycled)."""
+    now = timezone.now()
+    last_sign_of_life = job.heartbeat_at or job.created_at
+    if not job.is_active or now - last_sign_of_life < ABANDONED_AFTER:
+        return False
+    if ExportJob.objects.filter(pk=job.pk, status=job.status, heartbeat_at=job.heartbeat_at).update(
+            status=ExportJob.QUEUED, heartbeat_at=now, rows_done=0):
+        logger.warning(f'Restarting abandoned export {job.pk}')
+        start_job(job.pk)
+        return True
+    return False
+
+
+def run_export_job(job_id):
+    """Write the file of a queued job; the job row is claimed first so only one thread runs it."""
+    now = timezone.now()
+    if not ExportJob.objects.filter(pk=job_id, status=ExportJob.QUEUED).update(
+            status=ExportJob.RUNNING, heartbeat_at=now, rows_done=0):
+        return
+    job = ExportJob.objects.get(pk=job_id)
+    columns = COLUMN_SETS[job.columns]
+    qs = sort_students(filter_students(Student.objects.order_by(DEFAULT_ORDERING), job.params), job.params)
+    handle, path = tempfile.mkstemp(suffix='.csv')
+    written = 0
+    try:
+        ExportJob.objects.filter(pk=job_id).update(rows_total=qs.count())
+
+        def counted(rows):
+            nonlocal written
+            for row in rows:
+                written += 1
+                if written % PROGRESS_EVERY == 0:
+                    ExportJob.objects.filter(pk=job_id).update(rows_done=written, heartbeat_at=timezone.now())
+                yield row
+
+        with os.fdopen(handle, 'w', newline='', encoding='utf-8') as f:
+            for text in stream_csv(counted(export_rows(qs, columns)), export_header(columns)):
+                f.write(text)
+        with open(path, 'rb') as f:
+            job.file.save(f'students-{job.columns}-{now:%Y%m%d-%H%M%S}.csv', File(f), save=False)
+        finished = timezone.now()
+        ExportJob.objects.filter(pk=job_id).update(
+            status=ExportJob.DONE, file=job.file.name, rows_done=written, rows_total=written,
+            heartbeat_at=finished, finished_at=finished)
+        logger.info(f'Export {job_id} written to {job.file.name}')
+    except Exception as e:
+        logger.exception(f'Export {job_id} failed')
+        ExportJob.objects.filter(pk=job_id).update(status=ExportJob.FAILED, error=str(e),
+                                                   finished_at=timezone.now())
+    finally:
+        os.remove(path)
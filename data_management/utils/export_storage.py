@@ -0,0 +1,33 @@
+"""
+Storage of the student export files.
+
+Exports carry every column (passport, NIK, health data), so they are not
+written to the default storage: MEDIA_ROOT is served by nginx under
+``/media/`` without a login. The ``exports`` storage (``EXPORTS_ROOT``)
+is outside it, and its files are only read by the export views, behind
+``require_export_staff``.
+"""
+from django.core.files.storage import storages
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.functional import LazyObject, empty
+
+
+class ExportStorage(LazyObject):
+    def _setup(self):
+        self._wrapped = storages['exports']
+
+
+export_storage = ExportStorage()
+
+
+def get_export_storage():
+    """``ExportJob.file`` storage; a callable so migrations refer to it instead of a location."""
+    return export_storage
+
+
+@receiver(setting_changed)
+def reset_export_storage(*, setting, **kwargs):
+    # like default_storage, follow override_settings(STORAGES=...)
+    if setting == 'STORAGES':
+        export_storage._wrapped = empty
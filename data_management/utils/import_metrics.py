@@ -0,0 +1,131 @@
+"""
+Timing and resource accounting for ``seed_students_from_csv``.
+
+``ImportMetrics`` collects wall time per pipeline stage (read, parse,
+lookup, validate, write), database query count and time, peak RSS and a
+sample of the slowest rows, and turns them into the ``--report`` JSON.
+Stages are exclusive: entering a nested stage pauses the enclosing one,
+so the stage times add up to (at most) the wall time. Parse and validate
+are measured per row inside ``parse_row``; with ``--workers`` they are
+summed over the worker processes and can exceed the wall time.
+"""
+import heapq
+import json
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+class ImportMetrics:
+    STAGES = ('read', 'parse', 'lookup', 'validate', 'write')
+    SLOWEST_ROWS = 10
+
+    def __init__(self):
+        self.stages = dict.fromkeys(self.STAGES, 0.0)
+        self.rows = 0
+        self.queries = 0
+        self.query_time = 0.0
+        self.slowest = []  # min-heap of (seconds, row_number, stage)
+        self._stack = []
+        self.started_at = datetime.now(timezone.utc)
+        self._started = time.perf_counter()
+        self._finished = None
+
+    @contextmanager
+    def stage(self, name):
+        now = time.perf_counter()
+        if self._stack:
+            self.stages[self._stack[-1][0]] += now - self._stack[-1][1]
+        self._stack.append([name, now])
+        try:
+            yield
+        finally:
+            name, since = self._stack.pop()
+            now = time.perf_counter()
+            self.stages[name] += now - since
+            if self._stack:
+                self._stack[-1][1] = now
+
+    def timed(self, name, iterable):
+        """Yield from ``iterable``, counting the time spent producing each item as stage ``name``."""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def observe(self, records):
+        """Pipeline stage: add each parsed record's parse/validate timings and pass it on."""
+        for record in records:
+            self.rows += 1
+            parse_time, validate_time = record['timings']
+            self.stages['parse'] += parse_time
+            self.stages['validate'] += validate_time
+            self.note_row(record['row'], parse_time + validate_time, 'parse+validate')
+            yield record
+
+    def note_row(self, row_number, seconds, stage):
+        entry = (seconds, row_number, stage)
+        if len(self.slowest) < self.SLOWEST_ROWS:
+            heapq.heappush(self.slowest, entry)
+        elif entry > self.slowest[0]:
+            heapq.heapreplace(self.slowest, entry)
+
+    def count_query(self, execute, sql, params, many, context):
+        """``connection.execute_wrapper`` hook counting queries and their time."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.query_time += time.perf_counter() - started
+
+    def finish(self):
+        self._finished = time.perf_counter()
+
+    @property
+    def duration(self):
+        return (self._finished or time.perf_counter()) - self._started
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.duration if self.duration else 0.0
+
+    @staticmethod
+    def peak_rss_mb(children=False):
+        """Peak resident set size of this process (or of its finished children, e.g. parse workers)."""
+        if resource is None:
+            return None
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        return usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+    def report(self, **extra):
+        return {
+            'started_at': self.started_at.isoformat(),
+            'duration_s': round(self.duration, 3),
+            'rows': self.rows,
+            'rows_per_second': round(self.rows_per_second, 1),
+            'stages_s': {name: round(seconds, 3) for name, seconds in self.stages.items()},
+            'db': {'queries': self.queries, 'time_s': round(self.query_time, 3)},
+            'peak_rss_mb': self.peak_rss_mb(),
+            'workers_peak_rss_mb': self.peak_rss_mb(children=True),
+            'slowest_rows': [
+                {'row': row_number, 'seconds': round(seconds, 4), 'stage': stage}
+                for seconds, row_number, stage in sorted(self.slowest, reverse=True)
+            ],
+            **extra,
+        }
+
+    def write_report(self, path, **extra):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(**extra), f, indent=2)
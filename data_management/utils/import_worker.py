@@ -0,0 +1,49 @@
+"""
+Process-pool entry points for the student import commands.
+
+Worker processes are spawned fresh, so this module must not import models
+at import time: Django has to be set up before ``student_import`` (and with
+it ``data_management.models``) can be loaded. For the same reason the
+column plan (with the known import hashes) arrives pickled and is only unpickled after ``django.setup()``.
+
+The settings are passed explicitly (``worker_settings()``): a spawned
+process only inherits the parent's environment, which ``load_dotenv()``
+may have changed after the parent picked its settings.
+"""
+import os
+import pickle
+
+import django
+from django.conf import settings
+
+_plan = None
+_known_hashes = frozenset()
+
+
+def worker_settings():
+    """Return the parent's ``(settings module, DJANGO_ENV)``; pass it to ``init_worker``."""
+    return settings.SETTINGS_MODULE, getattr(settings, 'DJANGO_ENV', None)
+
+
+def init_worker(parent_settings, pickled_state=None):
+    global _plan, _known_hashes
+    settings_module, django_env = parent_settings
+    os.environ['DJANGO_SETTINGS_MODULE'] = settings_module
+    if django_env is not None:
+        os.environ['DJANGO_ENV'] = django_env
+    django.setup()
+    if pickled_state is not None:
+        _plan, _known_hashes = pickle.loads(pickled_state)
+
+
+def parse_chunk(chunk):
+    from data_management.utils.student_import import parse_chunk as parse
+
+    return parse(_plan, chunk, _known_hashes)
+
+
+def hash_password(raw_password):
+    """Run the configured password hasher; used by ``issue_credentials``."""
+    from django.contrib.auth.hashers import make_password
+
+    return make_password(raw_password)
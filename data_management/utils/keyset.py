@@ -0,0 +1,115 @@
+"""
+Keyset ("seek") pagination.
+
+An OFFSET page makes the database produce and throw away every row
+before it, and Django's paginator adds a ``COUNT(*)`` on top. Here a
+page starts right after (or before) a known row instead: the cursor
+holds that row's values of the queryset's ordering, with the primary
+key appended as a tie-breaker, and the page is
+
+    WHERE (ordering) > (cursor values) ORDER BY ordering LIMIT size + 1
+
+so page N costs the same as page 1. The extra row tells whether there
+is another page in the direction of travel.
+
+Cursors are signed, so they are opaque to clients and cannot be forged
+into arbitrary filters. A cursor made for a different ordering (the
+user changed the sort) is ignored and the first page is returned.
+"""
+import uuid
+from functools import reduce
+from operator import or_
+
+from django.core import signing
+from django.db.models import Q
+
+SALT = 'data_management.keyset'
+
+
+class KeysetPage:
+    is_keyset = True
+
+    def __init__(self, object_list, has_next, has_previous, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def ordering_of(qs):
+    """The ordering of ``qs`` as (lookup, descending) pairs, ending with the primary key."""
+    ordering = []
+    for name in qs.query.order_by or qs.model._meta.ordering:
+        descending = name.startswith('-')
+        lookup = name.lstrip('-')
+        ordering.append((qs.model._meta.pk.name if lookup == 'pk' else lookup, descending))
+    pk_name = qs.model._meta.pk.name
+    if not any(lookup == pk_name for lookup, descending in ordering):
+        ordering.append((pk_name, ordering[-1][1] if ordering else False))
+    return ordering
+
+
+def value_of(obj, lookup):
+    for name in lookup.split('__'):
+        obj = getattr(obj, name)
+    return str(obj) if isinstance(obj, uuid.UUID) else obj
+
+
+def make_cursor(obj, ordering, direction):
+    return signing.dumps({
+        'o': [[lookup, descending] for lookup, descending in ordering],
+        'v': [value_of(obj, lookup) for lookup, descending in ordering],
+        'd': direction,
+    }, salt=SALT)
+
+
+def read_cursor(cursor, ordering):
+    try:
+        data = signing.loads(cursor, salt=SALT)
+    except signing.BadSignature:
+        return None
+    if [tuple(key) for key in data.get('o', [])] != ordering or data.get('d') not in ('next', 'prev'):
+        return None
+    return data['v'], data['d']
+
+
+def after(ordering, values, backwards=False):
+    """Q for rows sorting after ``values`` (before them if ``backwards``) in ``ordering``."""
+    clauses = []
+    for index, (lookup, descending) in enumerate(ordering):
+        equal = {key: value for (key, _), value in zip(ordering[:index], values[:index])}
+        comparison = 'lt' if descending != backwards else 'gt'
+        clauses.append(Q(**equal, **{f'{lookup}__{comparison}': values[index]}))
+    return reduce(or_, clauses)
+
+
+def keyset_page(qs, page_size, cursor=None):
+    """The page of ``qs`` (which must be ordered) that ``cursor`` points at, or the first page."""
+    ordering = ordering_of(qs)
+    order_by = [f"{'-' if descending else ''}{lookup}" for lookup, descending in ordering]
+    position = read_cursor(cursor, ordering) if cursor else None
+    if position is None:
+        rows = list(qs.order_by(*order_by)[:page_size + 1])
+        has_next, has_previous = len(rows) > page_size, False
+    elif position[1] == 'next':
+        rows = list(qs.filter(after(ordering, position[0])).order_by(*order_by)[:page_size + 1])
+        has_next, has_previous = len(rows) > page_size, True
+    else:
+        reverse = [f"{'' if descending else '-'}{lookup}" for lookup, descending in ordering]
+        rows = list(qs.filter(after(ordering, position[0], backwards=True)).order_by(*reverse)[:page_size + 1])
+        has_next, has_previous = True, len(rows) > page_size
+    rows = rows[:page_size]
+    if position is not None and position[1] == 'prev':
+        rows.reverse()
+    return KeysetPage(
+        rows, has_next, has_previous,
+        next_cursor=make_cursor(rows[-1], ordering, 'next') if rows and has_next else None,
+        previous_cursor=make_cursor(rows[0], ordering, 'prev') if rows and has_previous else None,
+    )
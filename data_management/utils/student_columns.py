@@ -0,0 +1,36 @@
+"""
+Columns loaded by the student listings.
+
+A listing loads the columns it renders and nothing else: the staff list
+``LIST_FIELDS`` and the admin changelist ``ADMIN_LIST_FIELDS`` (through
+``only()``, with the user's name and email joined by ``select_related``).
+The exports and the typeahead read theirs with ``values_list`` (see
+``student_export`` and ``student_suggest``). The wide fields (the
+achievement texts, the organization and disease history) are loaded by
+the detail and edit pages only.
+
+With ``DEBUG`` on, a listing query that still loads every column is
+logged by ``check_projected()``, and reading a field a listing left
+out (one query per row) is logged by ``Student.refresh_from_db``.
+"""
+import logging
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+USER_FIELDS = ['user__username', 'user__first_name', 'user__last_name', 'user__email']
+
+# partials/student_rows.html, plus the keyset sort keys (student_query.SORT_FIELDS)
+LIST_FIELDS = [
+    'is_draft', 'passport_number', 'nik', 'degree_level', 'semester_level', 'faculty', 'major', 'level',
+    'full_name_key', 'email_key', *USER_FIELDS,
+]
+# StudentAdmin.list_display
+ADMIN_LIST_FIELDS = ['level', 'faculty', 'major', *USER_FIELDS]
+
+
+def check_projected(qs, listing):
+    """Log (with DEBUG on) when ``qs``, the rows of ``listing``, loads every Student column."""
+    if settings.DEBUG and qs.query.deferred_loading == (frozenset(), True):
+        logger.warning('%s loads every Student column; list the ones it renders with only()', listing)
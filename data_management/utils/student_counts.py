@@ -0,0 +1,113 @@
+"""
+Student counts for the staff list header.
+
+The number of students is kept in ``row_count`` of the students
+``DataVersion`` row: the Student signals add or remove one, imports
+(which bypass the signals) recount, and a missing count is computed on
+first use. Reading it is a primary-key lookup instead of a COUNT over
+the table; ``estimated_rows()`` reads PostgreSQL's planner statistics
+where a rough figure is enough.
+
+Counts of a filtered list are cached per filter under the data version,
+so they are computed once per change of the data (per worker; the cache
+is local memory). When a filtered count is not cached yet and the
+PostgreSQL planner expects more than ``ESTIMATE_ABOVE`` rows, the
+estimate is returned instead, flagged as approximate ("≈" in the list).
+
+The filter dropdowns show how many students each option would leave
+(``facet_counts()``): one query counts every option of every choice
+field with conditional aggregates, cached the same way.
+"""
+import hashlib
+import json
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db import connection
+from django.db import models
+from django.db.models import F, Q
+
+from data_management.models import DataVersion, Student
+from data_management.utils.data_version import STUDENTS, current_version, version_tag
+from data_management.utils.student_query import (
+    CHOICE_FILTERS, choice_filter, filter_query, filter_students, search_only,
+)
+
+ESTIMATE_ABOVE = 5000
+CACHE_SECONDS = 60 * 60
+
+Count = namedtuple('Count', 'value approximate')
+
+FACET_CHOICES = {
+    'gender': Student.GENDER_CHOICES,
+    'degree_level': Student.DEGREE_LEVEL_CHOICES,
+    'level': Student.LEVEL_CHOICES,
+    'marital_status': Student.MARITAL_STATUS_CHOICES,
+}
+
+
+def recount_students():
+    total = Student.objects.count()
+    if not DataVersion.objects.filter(name=STUDENTS).update(row_count=total):
+        DataVersion.objects.get_or_create(name=STUDENTS, defaults={'row_count': total})
+    return total
+
+
+def students_added(delta):
+    DataVersion.objects.filter(name=STUDENTS, row_count__isnull=False).update(row_count=F('row_count') + delta)
+
+
+def total_students():
+    total = DataVersion.objects.filter(name=STUDENTS).values_list('row_count', flat=True).first()
+    return recount_students() if total is None else total
+
+
+def estimated_rows(qs):
+    """The PostgreSQL planner's estimate of the rows in ``qs``, or None on other databases."""
+    if connection.vendor != 'postgresql':
+        return None
+    plan = json.loads(qs.order_by().values('pk').explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def cache_key(kind, params):
+    """Cache key of ``kind`` for the filters of ``params`` at the current data version."""
+    selected = hashlib.sha1(json.dumps(filter_query(params), sort_keys=True).encode()).hexdigest()
+    return f'{kind}:{version_tag(current_version())}:{selected}'
+
+
+def count_students(qs, params, estimate=True):
+    """The number of students in ``qs``, which ``params`` (e.g. ``request.GET``) filtered."""
+    key = cache_key('student_count', params)
+    total = cache.get(key)
+    if total is not None:
+        return Count(total, False)
+    if estimate:
+        rows = estimated_rows(qs)
+        if rows is not None and rows > ESTIMATE_ABOVE:
+            return Count(rows, True)
+    total = qs.count()
+    cache.set(key, total, CACHE_SECONDS)
+    return Count(total, False)
+
+
+def facet_counts(params):
+    """``{field: [(value, label, count), ...]}`` for the choice filters, given the filters in ``params``.
+
+    Each field is counted under the search and the other fields' filters
+    but not its own, so every option shows what picking it would leave.
+    """
+    key = cache_key('student_facets', params)
+    facets = cache.get(key)
+    if facets is None:
+        options = [(field, value, label) for field in CHOICE_FILTERS for value, label in FACET_CHOICES[field]]
+        searched = filter_students(Student.objects.order_by(), search_only(params))
+        totals = searched.aggregate(**{
+            f'option_{index}': models.Count('pk', filter=Q(**{field: value}) & choice_filter(params, skip=field))
+            for index, (field, value, label) in enumerate(options)
+        })
+        facets = {field: [] for field in CHOICE_FILTERS}
+        for index, (field, value, label) in enumerate(options):
+            facets[field].append((value, label, totals[f'option_{index}']))
+        cache.set(key, facets, CACHE_SECONDS)
+    return facets
@@ -0,0 +1,1268 @@
+"""
+Helpers for importing students from CSV files.
+
+Used by the ``seed_students_from_csv`` management command. An import is a
+chain of generator stages::
+
+    CsvSource.rows() -> parse_rows() -> reject_invalid() -> importer.import_chunk()
+
+Parsing follows a ``ColumnPlan`` compiled once per file from its header
+and a sample of rows (see ``get_column_plan()``). ``parse_rows_parallel()`` is a drop-in replacement
+for ``parse_rows()`` that spreads the CPU-bound parsing over a process pool.
+
+``RowStudentImporter`` saves one row at a time, ``BulkStudentImporter``
+prefetches lookups and writes each chunk in batches, and
+``DryRunStudentImporter`` does the bulk lookups and checks without writing
+(its problems go to a ``RejectsReport``). ``ImportCheckpoint``
+and ``RejectsWriter`` let the command resume an interrupted run and stream
+rejected rows to a CSV file instead of keeping them in memory.
+
+New users get unusable passwords; run ``issue_credentials`` afterwards to
+hash and hand out initial passwords in one batched, parallel pass.
+"""
+import bisect
+import csv
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import pickle
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.db import transaction
+from django.db.models import Q
+
+from data_management.models import PROFILE_DETAIL_FIELDS, Student, StudentProfileDetail
+from data_management.signals import profile_signal_disabled
+
+# fields we expect (based on provided index + user fields)
+EXPECTED_FIELDS = [
+    'email', 'full_name', 'passport_number', 'nik', 'lapdik_number',
+    'birth_place', 'birth_date', 'gender', 'arrival_date', 'school_origin',
+    'citizenship_status', 'marital_status', 'region_origin',
+    'whatsapp_number', 'institution', 'faculty', 'major',
+    'degree_level', 'semester_level', 'latest_grade', 'home_name',
+    'home_location', 'parents_name', 'parents_phone', 'guardian_name',
+    'guardian_phone', 'education_funding', 'living_cost', 'monthly_income',
+    'photo_url', 'username', 'disease_history', 'disease_status',
+    'sport_interest', 'sport_achievement', 'art_interest',
+    'art_achievement', 'literacy_interest', 'literacy_achievement',
+    'science_interest', 'science_achievement', 'mtq_interest',
+    'mtq_achievement', 'media_interest', 'media_achievement',
+    'organization_history', 'scholarship_source', 'level', 'is_draft'
+]
+
+# Only map CSV columns to actual concrete Student model fields...
+STUDENT_MODEL_FIELDS = {
+    f.name for f in Student._meta.get_fields()
+    if getattr(f, 'concrete', True) and not getattr(f, 'many_to_many', False) and not getattr(f, 'auto_created',
+                                                                                              False)
+}
+# ...and to the StudentProfileDetail fields, which are set through their Student attributes.
+DETAIL_MODEL_FIELDS = set(PROFILE_DETAIL_FIELDS)
+
+
+DATE_FORMATS = ["%Y-%m-%d", "%Y/%m/%d", "%d/%m/%Y", "%m/%d/%Y", "%d-%m-%Y"]
+
+# Student fields that need more than stripping; everything else is stored as text.
+FIELD_KINDS = {
+    'birth_date': 'date',
+    'arrival_date': 'date',
+    'semester_level': 'int',
+    'latest_grade': 'decimal',
+    'living_cost': 'decimal',
+    'monthly_income': 'decimal',
+    'is_draft': 'bool',
+}
+
+# Rows looked at when inferring per-column formats.
+PLAN_SAMPLE_SIZE = 500
+
+
+def try_parse_date(value):
+    """Try several common date formats, return a date object (isoformat) or None."""
+    if not value:
+        return None
+    value = value.strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except Exception:
+            continue
+    # last resort, try ISO parse
+    try:
+        return datetime.fromisoformat(value).date()
+    except Exception:
+        return None
+
+
+class DateConverter:
+    """Parse dates with the format inferred for a column, falling back to ``try_parse_date`` for outliers."""
+
+    def __init__(self, fmt):
+        self.fmt = fmt
+
+    def __call__(self, value):
+        if not value:
+            return None
+        try:
+            return datetime.strptime(value, self.fmt).date()
+        except ValueError:
+            return try_parse_date(value)
+
+    def __str__(self):
+        return f'date {self.fmt}'
+
+
+def infer_date_converter(samples):
+    """Pick the first format in ``DATE_FORMATS`` that parses every sampled value (or else the most of them)."""
+    best, best_hits = None, 0
+    for fmt in DATE_FORMATS:
+        hits = 0
+        for value in samples:
+            try:
+                datetime.strptime(value, fmt)
+                hits += 1
+            except ValueError:
+                pass
+        if samples and hits == len(samples):
+            return DateConverter(fmt)
+        if hits > best_hits:
+            best, best_hits = fmt, hits
+    return DateConverter(best) if best else try_parse_date
+
+
+def to_int(value):
+    try:
+        return int(value) if value is not None else None
+    except Exception:
+        return None
+
+
+def parse_bool(value):
+    if value is None:
+        return False
+    v = str(value).strip().lower()
+    if v in ("1", "true", "t", "yes", "y", "on"):
+        return True
+    if v in ("0", "false", "f", "no", "n", "off"):
+        return False
+    return False
+
+
+def to_decimal(value):
+    if value is None or value == "":
+        return None
+    try:
+        # Remove common thousand separators
+        v = str(value).replace(",", "")
+        return Decimal(v)
+    except (InvalidOperation, ValueError):
+        return None
+
+
+def split_full_name(full_name):
+    """Split a full name into ``(first_name, last_name)`` the way ``User`` stores it."""
+    parts = full_name.split()
+    return parts[0], ' '.join(parts[1:]) if len(parts) > 1 else ''
+
+
+def chunked(items, size):
+    """Yield successive lists of at most ``size`` items."""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ============================================================================
+# COLUMN PLAN
+# Header matching and format inference happen once per file; every row is
+# then a straight list -> record transform.
+# ============================================================================
+
+class ColumnPlan:
+    """
+    Compiled mapping from CSV column positions to User/Student fields.
+
+    Built once from the header and a sample of rows: every used column gets
+    its index, target field and a single converter (e.g. ``date %m/%d/%Y``
+    for a birth date column). Headers match fields case-insensitively and
+    the first of duplicate headers wins. The plan is plain data, so it can be
+    handed to parse worker processes.
+    """
+
+    IDENTITY_FIELDS = ('username', 'email', 'full_name')
+
+    def __init__(self, fieldnames, sample_rows=()):
+        self.fieldnames = list(fieldnames)
+        self.width = len(self.fieldnames)
+        self.username_index = self.email_index = self.full_name_index = None
+        self.columns = []  # (index, field, converter); converter None means plain text
+        self.ignored = []  # (index, header, reason)
+        seen = set()
+        for index, header in enumerate(self.fieldnames):
+            name = header.strip() if header else ''
+            key = name.lower()
+            if not key:
+                self.ignored.append((index, name, 'blank header'))
+            elif key in seen:
+                self.ignored.append((index, name, 'duplicate header'))
+            elif key in self.IDENTITY_FIELDS:
+                setattr(self, f'{key}_index', index)
+            elif key in EXPECTED_FIELDS and (key in STUDENT_MODEL_FIELDS or key in DETAIL_MODEL_FIELDS):
+                self.columns.append((index, key, self._converter(key, index, sample_rows)))
+            else:
+                self.ignored.append((index, name, 'no matching field'))
+            seen.add(key)
+
+    @staticmethod
+    def _converter(field, index, sample_rows):
+        kind = FIELD_KINDS.get(field)
+        if kind == 'date':
+            samples = [row[index].strip() for row in sample_rows if index < len(row) and row[index].strip()]
+            return infer_date_converter(samples)
+        return {'int': to_int, 'decimal': to_decimal, 'bool': parse_bool}.get(kind)
+
+    def parse(self, values):
+        """Return ``(username, email, full_name, student_defaults)`` for one row of raw values."""
+        if len(values) < self.width:
+            values = values + [None] * (self.width - len(values))
+        username, email, full_name = (
+            values[index].strip() if index is not None and values[index] else None
+            for index in (self.username_index, self.email_index, self.full_name_index)
+        )
+        if not username and email:
+            # derive username from email local-part
+            username = email.split('@')[0]
+
+        student_defaults = {}
+        for index, field, convert in self.columns:
+            value = values[index]
+            value = value.strip() or None if value else None
+            if convert is not None:
+                student_defaults[field] = convert(value)
+            elif value is not None:
+                student_defaults[field] = value
+
+        # Ensure required non-nullable fields have defaults
+        if student_defaults.get('semester_level') is None:
+            student_defaults['semester_level'] = 1
+        if not student_defaults.get('degree_level'):
+            student_defaults['degree_level'] = 'S1'
+        return username, email, full_name, student_defaults
+
+    def column_index(self, field):
+        """Position of the column feeding ``field`` (a Student field or identity column), or None."""
+        if field in self.IDENTITY_FIELDS:
+            return getattr(self, f'{field}_index')
+        for index, column_field, convert in self.columns:
+            if column_field == field:
+                return index
+        return None
+
+    def explain(self):
+        """Human readable lines describing what happens to every column."""
+        targets = {}
+        if self.username_index is not None:
+            targets[self.username_index] = ('User.username', 'text')
+        if self.email_index is not None:
+            targets[self.email_index] = ('User.email', 'text')
+        if self.full_name_index is not None:
+            targets[self.full_name_index] = ('User.first_name/last_name', 'split on first space')
+        for index, field, convert in self.columns:
+            if convert is None:
+                description = 'text'
+            elif convert is try_parse_date:
+                description = 'date, format guessed per value'
+            else:
+                description = str(convert) if isinstance(convert, DateConverter) else convert.__name__
+            targets[index] = (f'Student.{field}', description)
+        for index, header, reason in self.ignored:
+            targets[index] = (None, reason)
+
+        lines = []
+        for index in range(self.width):
+            target, description = targets[index]
+            header = self.fieldnames[index]
+            if target is None:
+                lines.append(f'[{index}] {header!r}: ignored ({description})')
+            else:
+                lines.append(f'[{index}] {header!r} -> {target} ({description})')
+        if self.username_index is None:
+            lines.append('username: derived from the email local-part')
+        return lines
+
+
+def get_column_plan(source):
+    """
+    Build the plan for ``source`` from its header and a sample of its rows.
+
+    Not cached by header: the inferred date formats depend on the rows, so
+    two files with the same header can need different plans.
+    """
+    return ColumnPlan(source.fieldnames, source.sample(PLAN_SAMPLE_SIZE))
+
+
+# ============================================================================
+# PIPELINE STAGES
+# read -> parse -> reject -> write, each stage is a generator so only
+# the chunk being written is held in memory.
+# ============================================================================
+
+class CsvSource:
+    """
+    Read a CSV file record by record while tracking the byte offset after each record.
+
+    The file is opened in binary mode so the offset can be stored in a
+    checkpoint and handed back to ``rows()`` to continue after that record.
+    """
+
+    def __init__(self, path, delimiter=',', encoding='utf-8'):
+        self.delimiter = delimiter
+        self.encoding = encoding
+        self.offset = 0
+        self._file = open(path, 'rb')
+        try:
+            header = next(csv.reader(self._lines(), delimiter=delimiter), None)
+        except Exception:
+            self._file.close()
+            raise
+        if header is None:
+            self._file.close()
+            raise ValueError('CSV file is empty')
+        self.fieldnames = header
+        self.header_hash = hashlib.sha1(delimiter.join(header).encode('utf-8')).hexdigest()
+        self.data_offset = self.offset
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    def _lines(self):
+        while True:
+            line = self._file.readline()
+            if not line:
+                return
+            self.offset = self._file.tell()
+            yield line.decode(self.encoding)
+
+    def rows(self, offset=None, row_number=0):
+        """Yield ``(row_number, values, end_offset)`` for every non-blank record."""
+        self.offset = offset or self.data_offset
+        self._file.seek(self.offset)
+        for values in csv.reader(self._lines(), delimiter=self.delimiter):
+            if not values:
+                continue
+            row_number += 1
+            yield row_number, values, self.offset
+
+    def sample(self, size):
+        """The first ``size`` records, used to infer the column plan."""
+        return [values for _, values, _ in islice(self.rows(), size)]
+
+
+def content_hash(username, email, full_name, student_defaults):
+    """Digest of everything an import writes for one row; stored on the student as ``import_hash``."""
+    payload = json.dumps([username, email, full_name, student_defaults], default=str, sort_keys=True)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def validation_issues(error):
+    """``(field, message)`` pairs of a ValidationError; non-field errors get field None."""
+    return [(None if field == NON_FIELD_ERRORS else field, message)
+            for field, messages in error.message_dict.items() for message in messages]
+
+
+def validate_defaults(student_defaults):
+    """Validate the Student and StudentProfileDetail fields present in ``student_defaults``; raises ValidationError."""
+    student = Student(**student_defaults)
+    errors = {}
+    for instance in (student, student.detail):
+        exclude = [f.name for f in type(instance)._meta.concrete_fields if f.name not in student_defaults]
+        try:
+            instance.full_clean(exclude=exclude, validate_unique=False, validate_constraints=False)
+        except ValidationError as ve:
+            errors.update(ve.message_dict)
+    if errors:
+        raise ValidationError(errors)
+
+
+def stored_import_hashes():
+    """The ``import_hash`` of every student, for ``parse_row``'s unchanged-row check."""
+    return frozenset(Student.objects.exclude(import_hash='').values_list('import_hash', flat=True).iterator())
+
+
+def parse_row(plan, row_number, values, known_hashes=frozenset()):
+    """
+    Turn one raw CSV record into an import record using a ``ColumnPlan``.
+
+    This is the CPU-bound part of an import (type coercion and field
+    validation) and never touches the database, so it can run in a worker
+    process. Returns a dict with ``row``, ``values``, ``username``,
+    ``email``, ``full_name``, ``defaults``, ``hash``, ``unchanged``,
+    ``error`` (None when the row can be imported at all),
+    ``student_error`` (None when the student fields are valid), ``issues``
+    (either error as ``(field, message)`` pairs) and ``timings`` (parse and
+    validate seconds, for ``ImportMetrics``). Rows whose hash is in
+    ``known_hashes`` were imported before exactly as they are, so they are
+    not validated.
+
+    A row with a ``student_error`` still reaches the importer: as before
+    validation moved here, its user is created or updated and only the
+    student is rejected.
+    """
+    started = time.perf_counter()
+    username, email, full_name, student_defaults = plan.parse(values)
+    record = {'row': row_number, 'values': values, 'username': username, 'email': email,
+              'full_name': full_name, 'defaults': None, 'hash': None, 'unchanged': False, 'error': None,
+              'student_error': None, 'issues': None}
+    if not username and not email:
+        record['error'] = 'missing username and email'
+        record['issues'] = [('email', record['error'])]
+    else:
+        record['defaults'] = student_defaults
+        record['hash'] = content_hash(username, email, full_name, student_defaults)
+        record['unchanged'] = record['hash'] in known_hashes
+    parsed = time.perf_counter()
+    if record['error'] is None and not record['unchanged']:
+        # validate only the columns present in the row; uniqueness is checked by the writer
+        try:
+            validate_defaults(student_defaults)
+        except ValidationError as ve:
+            record['student_error'] = f'student validation error: {ve.message_dict}'
+            record['issues'] = validation_issues(ve)
+    record['timings'] = (parsed - started, time.perf_counter() - parsed)
+    return record
+
+
+def parse_chunk(plan, chunk, known_hashes=frozenset()):
+    """Parse a list of ``(row_number, values, offset)``; module level so worker processes can run it."""
+    records = []
+    for row_number, values, offset in chunk:
+        record = parse_row(plan, row_number, values, known_hashes)
+        record['offset'] = offset
+        records.append(record)
+    return records
+
+
+def parse_rows(rows, plan, known_hashes=frozenset()):
+    for row_number, values, offset in rows:
+        record = parse_row(plan, row_number, values, known_hashes)
+        record['offset'] = offset
+        yield record
+
+
+def parse_rows_parallel(rows, plan, workers, chunk_size, known_hashes=frozenset()):
+    """
+    Parse rows in a process pool, yielding records in file order.
+
+    At most ``2 * workers`` chunks are in flight, so memory stays bounded no
+    matter how large the file is. Results are consumed in submission order,
+    which makes the output identical to ``parse_rows``.
+    """
+    from data_management.utils import import_worker
+
+    context = multiprocessing.get_context('spawn')
+    initargs = (import_worker.worker_settings(), pickle.dumps((plan, known_hashes)))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=import_worker.init_worker,
+                             initargs=initargs) as executor:
+        in_flight = deque()
+        for chunk in chunked(rows, chunk_size):
+            in_flight.append(executor.submit(import_worker.parse_chunk, chunk))
+            if len(in_flight) >= workers * 2:
+                yield from in_flight.popleft().result()
+        while in_flight:
+            yield from in_flight.popleft().result()
+
+
+def reject_invalid(records, reject):
+    """Drop records that failed parsing, reporting them through ``reject(row_number, message, row, issues)``."""
+    for record in records:
+        if record['error']:
+            reject(record['row'], record['error'], record['values'], record['issues'])
+            continue
+        yield record
+
+
+class ImportCheckpoint:
+    """Sidecar JSON file recording how far an import got, so ``--resume`` can continue from there."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def save(self, **state):
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class RejectsWriter:
+    """
+    Stream rejected rows to a CSV file: row number, error, then the original record.
+
+    The file is only created once the first row is rejected. When resuming,
+    pass ``resume_size`` (the size stored in the checkpoint) to drop rejects
+    written after the last committed chunk and append to the rest.
+    """
+
+    def __init__(self, path, fieldnames, resume_size=None):
+        self.path = path
+        self.fieldnames = fieldnames
+        self._file = None
+        self._writer = None
+        if resume_size and os.path.exists(path):
+            self._file = open(path, 'r+', newline='', encoding='utf-8')
+            self._file.truncate(resume_size)
+            self._file.seek(resume_size)
+            self._writer = csv.writer(self._file)
+
+    def write(self, row_number, message, row=None, issues=None):
+        if self._writer is None:
+            self._file = open(self.path, 'w', newline='', encoding='utf-8')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(['row', 'error'] + list(self.fieldnames))
+        self._writer.writerow([row_number, message] + list(row or []))
+
+    def size(self):
+        if self._file is None:
+            return 0
+        self._file.flush()
+        return self._file.tell()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+class RejectsReport:
+    """
+    Complete problem report of a dry run: one entry per row and column.
+
+    Each entry has the row number, the CSV column (empty for row-level
+    problems), its raw value and the reason. Written as CSV, or as a JSON
+    array when ``path`` ends in ``.json``. Entries are streamed to disk in
+    the order they are found (a chunk's parse errors come before its
+    uniqueness conflicts); the file is written even when it ends up empty.
+    """
+
+    FIELDS = ('row', 'column', 'value', 'reason')
+
+    def __init__(self, path, plan):
+        self.path = path
+        self.plan = plan
+        self.count = 0
+        self.as_json = path.lower().endswith('.json')
+        self._file = open(path, 'w', newline='', encoding='utf-8')
+        if self.as_json:
+            self._file.write('[')
+        else:
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(self.FIELDS)
+
+    def write(self, row_number, message, row=None, issues=None):
+        for field, reason in issues or [(None, message)]:
+            index = self.plan.column_index(field) if field else None
+            column = self.plan.fieldnames[index].strip() if index is not None else (field or '')
+            value = row[index] if index is not None and row and index < len(row) else None
+            entry = (row_number, column, value, reason)
+            if self.as_json:
+                self._file.write((',' if self.count else '') + '\n  ' + json.dumps(dict(zip(self.FIELDS, entry))))
+            else:
+                self._writer.writerow(entry)
+            self.count += 1
+
+    def size(self):
+        self._file.flush()
+        return self._file.tell()
+
+    def close(self):
+        if self.as_json:
+            self._file.write('\n]\n' if self.count else ']\n')
+        self._file.close()
+
+
+# ============================================================================
+# WRITERS
+# ============================================================================
+
+class BaseStudentImporter:
+    """
+    Shared bookkeeping for the import writers.
+
+    Counters are plain attributes so they can be stored in a checkpoint
+    (``totals()``/``restore()``). Only the first ``ERROR_SAMPLE_SIZE`` errors
+    are kept for the summary; every error is passed to ``on_error``.
+    """
+
+    ERROR_SAMPLE_SIZE = 20
+    TOTALS = ('created_users', 'updated_users', 'created_students', 'updated_students', 'skipped', 'unchanged',
+              'error_count')
+
+    def __init__(self, stdout, style, do_update=False, batch_size=500, on_error=None, metrics=None, quiet=False):
+        self.stdout = stdout
+        self.style = style
+        self.do_update = do_update
+        self.batch_size = batch_size
+        self.on_error = on_error
+        self.metrics = metrics
+        self.quiet = quiet
+        self.User = get_user_model()
+
+        self.created_users = 0
+        self.updated_users = 0
+        self.created_students = 0
+        self.updated_students = 0
+        self.skipped = 0
+        self.unchanged = 0
+        self.error_count = 0
+        self.errors = []
+
+    def totals(self):
+        return {name: getattr(self, name) for name in self.TOTALS}
+
+    def restore(self, totals):
+        for name in self.TOTALS:
+            setattr(self, name, totals.get(name, 0))
+
+    def error(self, row_number, message, row=None, issues=None):
+        self.skipped += 1
+        self.error_count += 1
+        bisect.insort(self.errors, (row_number, message))
+        del self.errors[self.ERROR_SAMPLE_SIZE:]
+        if self.on_error is not None:
+            self.on_error(row_number, message, row, issues)
+
+    def say(self, message):
+        """Write a per-row progress line, unless running with ``--quiet``."""
+        if not self.quiet:
+            self.stdout.write(message)
+
+    def stage(self, name):
+        """Time the enclosed block as pipeline stage ``name`` when metrics are collected."""
+        if self.metrics is None:
+            return nullcontext()
+        return self.metrics.stage(name)
+
+    @contextmanager
+    def session(self):
+        """Wrap the whole run (e.g. prefetching, disconnecting signals)."""
+        yield
+
+    def import_chunk(self, chunk):
+        """Import a list of parsed records (see ``parse_row``)."""
+        raise NotImplementedError
+
+    def changed_records(self, chunk):
+        """Drop (and count) records identical to their last import; they need no lookups or writes."""
+        changed = [record for record in chunk if not record['unchanged']]
+        self.unchanged += len(chunk) - len(changed)
+        return changed
+
+
+class RowStudentImporter(BaseStudentImporter):
+    """Look up and save every row individually, each student in its own transaction."""
+
+    def import_chunk(self, chunk):
+        for record in self.changed_records(chunk):
+            started = time.perf_counter()
+            with self.stage('write'):
+                self.import_row(record)
+            if self.metrics is not None:
+                self.metrics.note_row(record['row'], time.perf_counter() - started, 'write')
+
+    def import_row(self, record):
+        User = self.User
+        do_update = self.do_update
+        row_number, row = record['row'], record['values']
+        username, email = record['username'], record['email']
+
+        # find or create user
+        try:
+            user = None
+            with self.stage('lookup'):
+                if username:
+                    try:
+                        user = User.objects.get(username=username)
+                    except User.DoesNotExist:
+                        user = None
+                if user is None and email:
+                    try:
+                        user = User.objects.get(email=email)
+                    except User.DoesNotExist:
+                        user = None
+
+            if user is None:
+                # create user
+                first_name = ''
+                last_name = ''
+                full_name_val = record['full_name']
+                if full_name_val:
+                    first_name, last_name = split_full_name(full_name_val)
+
+                # No password here: hashing dominates import time, so initial
+                # passwords are issued afterwards by ``issue_credentials``.
+                try:
+                    if hasattr(User.objects, 'create_user'):
+                        user = User.objects.create_user(username=username, email=email or '', password=None)
+                    else:
+                        user = User.objects.create(username=username, email=email or '')
+                        user.set_unusable_password()
+                        user.save()
+                except Exception as e:
+                    self.error(row_number, f'user create error: {e}', row)
+                    return
+
+                if full_name_val:
+                    user.first_name = first_name
+                    user.last_name = last_name
+                    user.save()
+                self.created_users += 1
+            else:
+                # user exists
+                if do_update:
+                    changed = False
+                    full_name_val = record['full_name']
+                    if full_name_val:
+                        fn, ln = split_full_name(full_name_val)
+                        if user.first_name != fn or user.last_name != ln:
+                            user.first_name = fn
+                            user.last_name = ln
+                            changed = True
+                    if email and user.email != email:
+                        user.email = email
+                        changed = True
+                    if changed:
+                        user.save()
+                        self.updated_users += 1
+
+            student_defaults = record['defaults']
+
+            # find existing student by user, passport_number, or nik
+            student = None
+            with self.stage('lookup'):
+                try:
+                    student = Student.objects.get(user=user)
+                except Student.DoesNotExist:
+                    # try passport
+                    pnum = student_defaults.get('passport_number')
+                    nnum = student_defaults.get('nik')
+                    q = Q()
+                    if pnum:
+                        q |= Q(passport_number=pnum)
+                    if nnum:
+                        q |= Q(nik=nnum)
+                    if q:
+                        try:
+                            student = Student.objects.get(q)
+                        except Student.DoesNotExist:
+                            student = None
+                        except Student.MultipleObjectsReturned:
+                            student = None
+
+            # invalid student fields only matter if the row writes its student (a skipped row is not an error)
+            if record['student_error'] and (student is None or do_update):
+                self.error(row_number, record['student_error'], row, record['issues'])
+                return
+
+            if student is not None:
+                if do_update:
+                    for k, v in student_defaults.items():
+                        setattr(student, k, v)
+                    student.import_hash = record['hash']
+                    student._keep_import_hash = True
+                    try:
+                        with transaction.atomic():
+                            student.full_clean()
+                            student.save()
+                        self.updated_students += 1
+                        self.say(
+                            self.style.SUCCESS(f"Row {row_number}: Updated student for user {user.username}"))
+                    except ValidationError as ve:
+                        self.error(row_number, f'student validation error: {ve.message_dict}', row)
+                    except Exception as e:
+                        self.error(row_number, f'student save error: {e}', row)
+                else:
+                    self.skipped += 1
+                    self.say(self.style.WARNING(
+                        f"Row {row_number}: Student already exists for user {user.username} (skipped). Use --update to overwrite."))
+            else:
+                # create new
+                try:
+                    student = Student(user=user, import_hash=record['hash'], **student_defaults)
+                    student._keep_import_hash = True
+                    with transaction.atomic():
+                        student.save(force_insert=True)
+                    self.created_students += 1
+                    self.say(
+                        self.style.SUCCESS(f"Row {row_number}: Created student for user {user.username}"))
+                except ValidationError as ve:
+                    self.error(row_number, f'student validation error: {ve.message_dict}', row)
+                except Exception as e:
+                    self.error(row_number, f'student create error: {e}', row)
+
+        except Exception as e:
+            self.error(row_number, f'unhandled error: {e}', row)
+
+
+class BulkStudentImporter(BaseStudentImporter):
+    """
+    Import rows with in-memory lookups and batched writes.
+
+    Existing users are loaded once and indexed by username and email;
+    students are indexed by user, passport and NIK (primary keys only, the
+    rows themselves are fetched per chunk when ``--update`` needs them).
+    Each chunk is written with ``bulk_create``/``bulk_update`` inside one
+    transaction. When a batch insert fails the chunk falls back to per-row
+    saves so errors are still reported against the row that caused them.
+    """
+
+    USER_UPDATE_FIELDS = ['first_name', 'last_name', 'email']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.users_by_username = {}
+        self.users_by_email = {}
+        self.students_by_user = {}
+        self.students_by_passport = {}
+        self.students_by_nik = {}
+        # students created in the current chunk, and the ones loaded for updating
+        self.pending_students = {}
+        self.pending_by_user = {}
+        self.loaded_students = {}
+
+    @contextmanager
+    def session(self):
+        with self.stage('lookup'):
+            self.prefetch()
+        with profile_signal_disabled():
+            yield
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+    def prefetch(self):
+        """Load existing users and student keys into the lookup dicts."""
+        users = self.User.objects.only('id', 'username', 'email', 'first_name', 'last_name')
+        for user in users.iterator(chunk_size=2000):
+            self.users_by_username[user.username] = user
+            if user.email:
+                self.users_by_email.setdefault(user.email, user)
+        students = Student.objects.values_list('pk', 'user_id', 'passport_number', 'nik')
+        for pk, user_id, passport_number, nik in students.iterator(chunk_size=2000):
+            self.students_by_user[user_id] = pk
+            self._index_keys(pk, passport_number, nik)
+
+    def _index_keys(self, pk, passport_number, nik):
+        if passport_number:
+            self.students_by_passport[passport_number] = pk
+        if nik:
+            self.students_by_nik[nik] = pk
+
+    def _unindex_keys(self, pk, passport_number, nik):
+        if passport_number and self.students_by_passport.get(passport_number) == pk:
+            del self.students_by_passport[passport_number]
+        if nik and self.students_by_nik.get(nik) == pk:
+            del self.students_by_nik[nik]
+
+    def find_user(self, username, email):
+        user = self.users_by_username.get(username) if username else None
+        if user is None and email:
+            user = self.users_by_email.get(email)
+        return user
+
+    def find_student_pk(self, user):
+        """
+        Find the student of ``user``.
+
+        The per-row lookup falls back to a passport/NIK match, but there
+        ``create_profile`` has already given a new user a student, so such a
+        match only ever re-keys the user's own student. Here the signal is
+        off: a passport/NIK match is always a student of another user
+        (``Student.user`` is required), and taking it over would move that
+        student's data to this row. The row is left to ``unique_conflict``,
+        which rejects it like the per-row path does.
+        """
+        if user.pk:
+            return self.students_by_user.get(user.pk)
+        return self.pending_by_user.get(id(user))
+
+    def load_students(self, pks):
+        """Fetch the students a chunk is about to update, keyed by primary key."""
+        return Student.objects.select_related('profile_detail').in_bulk(list(pks))
+
+    def get_student(self, pk):
+        student = self.pending_students.get(pk) or self.loaded_students.get(pk)
+        if student is None:
+            student = self.loaded_students[pk] = Student.objects.select_related('profile_detail').get(pk=pk)
+        return student
+
+    def unique_conflict(self, student):
+        """Return a ValidationError naming every one of passport/NIK that already belongs to another student."""
+        errors = {}
+        for field, index in (('passport_number', self.students_by_passport), ('nik', self.students_by_nik)):
+            value = getattr(student, field)
+            owner = index.get(value) if value else None
+            if owner is not None and owner != student.pk:
+                errors[field] = [student.unique_error_message(Student, [field])]
+        return ValidationError(errors) if errors else None
+
+    # ------------------------------------------------------------------
+    # Staging
+    # ------------------------------------------------------------------
+    def import_chunk(self, chunk):
+        with self.stage('lookup'):
+            resolved = [self.resolve_row(record) for record in self.changed_records(chunk)]
+            if self.do_update:
+                pks = {entry['student_pk'] for entry in resolved if entry['student_pk'] is not None}
+                self.loaded_students = self.load_students(pks)
+            staged = [self.stage_student(entry) for entry in resolved]
+        try:
+            with self.stage('write'):
+                self.flush([entry for entry in staged if entry is not None])
+        finally:
+            self.pending_students = {}
+            self.pending_by_user = {}
+            self.loaded_students = {}
+
+    def resolve_row(self, record):
+        """Find or build the user for one parsed record."""
+        username, email, full_name_val = record['username'], record['email'], record['full_name']
+        entry = {'row': record['row'], 'values': record['values'], 'defaults': record['defaults'],
+                 'hash': record['hash'], 'student_error': record['student_error'], 'issues': record['issues'],
+                 'user_created': False, 'user_updated': False, 'rejected': False}
+        user = self.find_user(username, email)
+        if user is None:
+            user = self.User(username=username, email=email or '')
+            user.set_unusable_password()
+            if full_name_val:
+                user.first_name, user.last_name = split_full_name(full_name_val)
+            self.users_by_username[username] = user
+            if user.email:
+                self.users_by_email.setdefault(user.email, user)
+            entry['user_created'] = True
+        elif self.do_update:
+            changed = False
+            if full_name_val:
+                fn, ln = split_full_name(full_name_val)
+                if user.first_name != fn or user.last_name != ln:
+                    user.first_name = fn
+                    user.last_name = ln
+                    changed = True
+            if email and user.email != email:
+                user.email = email
+                changed = True
+            entry['user_updated'] = changed
+        entry['user'] = user
+        entry['student_pk'] = self.find_student_pk(user)
+        return entry
+
+    def stage_student(self, entry):
+        """Decide create/update/skip for one resolved row, without writing anything."""
+        row_number, user, student_defaults = entry['row'], entry['user'], entry['defaults']
+        entry['student_action'] = None
+        # re-run the lookup: earlier rows of this chunk may have created or re-keyed a student
+        pk = self.find_student_pk(user)
+        if pk is not None and not self.do_update:
+            self.skipped += 1
+            entry['message'] = self.style.WARNING(
+                f"Row {row_number}: Student already exists for user {user.username} (skipped). "
+                f"Use --update to overwrite.")
+            return entry
+        if entry['student_error']:
+            # the user is still written
+            self.reject(entry, entry['student_error'], entry['issues'])
+            return entry
+        if pk is not None:
+            student = self.get_student(pk)
+            student_defaults = dict(student_defaults, import_hash=entry['hash'])
+            previous = {k: getattr(student, k) for k in student_defaults}
+            for k, v in student_defaults.items():
+                setattr(student, k, v)
+            # field values were validated while parsing; only uniqueness is left
+            conflict = self.unique_conflict(student)
+            if conflict is not None:
+                for k, v in previous.items():
+                    setattr(student, k, v)
+                self.reject(entry, f'student validation error: {conflict.message_dict}', validation_issues(conflict))
+                return entry
+            self._unindex_keys(pk, previous.get('passport_number'), previous.get('nik'))
+            self._index_keys(pk, student.passport_number, student.nik)
+            entry['student_action'] = 'update'
+            # only changed columns go into the bulk UPDATE
+            entry['student_fields'] = [k for k, v in student_defaults.items() if previous[k] != v]
+            entry['previous'] = previous
+        else:
+            student = Student(user=user, import_hash=entry['hash'], **student_defaults)
+            conflict = self.unique_conflict(student)
+            if conflict is not None:
+                self.reject(entry, f'student validation error: {conflict.message_dict}', validation_issues(conflict))
+                return entry
+            self.pending_students[student.pk] = student
+            if user.pk:
+                self.students_by_user[user.pk] = student.pk
+            else:
+                self.pending_by_user[id(user)] = student.pk
+            self._index_keys(student.pk, student.passport_number, student.nik)
+            entry['student_action'] = 'create'
+        entry['student'] = student
+        return entry
+
+    def reject(self, entry, message, issues=None):
+        """Report the row of ``entry``; its user is still written, and is not reported again if that fails."""
+        entry['rejected'] = True
+        self.error(entry['row'], message, entry['values'], issues)
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+    def flush(self, staged):
+        """Write one staged chunk, then report its rows in order."""
+        with transaction.atomic():
+            self.write_users(staged)
+            self.write_students(staged)
+
+        for entry in staged:
+            message = entry.get('message')
+            if message:
+                self.say(message)
+
+    def write_users(self, staged):
+        new_users = []
+        seen = set()
+        for entry in staged:
+            user = entry['user']
+            if entry['user_created'] and id(user) not in seen:
+                seen.add(id(user))
+                new_users.append(user)
+        try:
+            with transaction.atomic():
+                self.User.objects.bulk_create(new_users, batch_size=self.batch_size)
+        except Exception:
+            # Fall back to per-row inserts so the failing row can be reported.
+            for user in new_users:
+                user.pk = None
+                user._state.adding = True
+                try:
+                    with transaction.atomic():
+                        user.save()
+                except Exception as e:
+                    user.pk = None
+                    user._import_error = f'user create error: {e}'
+        for user in new_users:
+            if user.pk is None:
+                self._drop_failed_user(user)
+            else:
+                self.created_users += 1
+        for entry in staged:
+            user = entry['user']
+            if entry['user_created'] and user.pk is None:
+                self._discard_student(entry)
+                if not entry['rejected']:
+                    self.error(entry['row'], user._import_error, entry['values'])
+
+        to_update = {}
+        for entry in staged:
+            if entry['user_updated']:
+                to_update[entry['user'].pk] = entry['user']
+        if to_update:
+            self.User.objects.bulk_update(list(to_update.values()), self.USER_UPDATE_FIELDS,
+                                          batch_size=self.batch_size)
+            self.updated_users += len(to_update)
+
+    def _drop_failed_user(self, user):
+        if self.users_by_username.get(user.username) is user:
+            del self.users_by_username[user.username]
+        if user.email and self.users_by_email.get(user.email) is user:
+            del self.users_by_email[user.email]
+
+    def _discard_student(self, entry):
+        """Undo the in-memory effect of a staged student that will not be written."""
+        student = entry.get('student')
+        action = entry['student_action']
+        entry['student_action'] = None
+        entry['message'] = None
+        if action == 'create':
+            self._unindex_keys(student.pk, student.passport_number, student.nik)
+            if self.students_by_user.get(student.user_id) == student.pk:
+                del self.students_by_user[student.user_id]
+        elif action == 'update':
+            self._unindex_keys(student.pk, student.passport_number, student.nik)
+            for k, v in entry['previous'].items():
+                setattr(student, k, v)
+            self._index_keys(student.pk, student.passport_number, student.nik)
+
+    def write_students(self, staged):
+        creates = [entry for entry in staged if entry['student_action'] == 'create']
+        updates = [entry for entry in staged if entry['student_action'] == 'update']
+
+        for entry in creates:
+            # re-attach so user_id picks up the primary key assigned by bulk_create
+            entry['student'].user = entry['user']
+        try:
+            with transaction.atomic():
+                Student.objects.bulk_create([entry['student'] for entry in creates], batch_size=self.batch_size)
+            failed = {}
+        except Exception:
+            failed = self._save_one_by_one(creates, create=True)
+        self.write_details([entry['student'] for entry in creates if entry['row'] not in failed])
+        for entry in creates:
+            student = entry['student']
+            if entry['row'] in failed:
+                self._discard_student(entry)
+                self.error(entry['row'], f"student create error: {failed[entry['row']]}", entry['values'])
+                continue
+            self.students_by_user[student.user_id] = student.pk
+            self.created_students += 1
+            entry['message'] = self.style.SUCCESS(
+                f"Row {entry['row']}: Created student for user {entry['user'].username}")
+
+        if updates:
+            # the detail fields go to their own table (write_details)
+            fields = sorted({field for entry in updates for field in entry['student_fields']} - DETAIL_MODEL_FIELDS)
+            changed = [entry for entry in updates if set(entry['student_fields']) - DETAIL_MODEL_FIELDS]
+            try:
+                if changed:
+                    with transaction.atomic():
+                        Student.objects.bulk_update([entry['student'] for entry in changed], fields,
+                                                    batch_size=self.batch_size)
+                failed = {}
+            except Exception:
+                failed = self._save_one_by_one(changed, create=False)
+            self.write_details([entry['student'] for entry in updates if entry['row'] not in failed])
+            for entry in updates:
+                if entry['row'] in failed:
+                    self._discard_student(entry)
+                    self.error(entry['row'], f"student save error: {failed[entry['row']]}", entry['values'])
+                    continue
+                self.updated_students += 1
+                entry['message'] = self.style.SUCCESS(
+                    f"Row {entry['row']}: Updated student for user {entry['user'].username}")
+
+    def write_details(self, students):
+        """Write the StudentProfileDetail rows the chunk changed (``save()`` already wrote those of saved students)."""
+        details = [student.detail for student in students if getattr(student, '_detail_changed', False)]
+        existing = [detail for detail in details if not detail._state.adding]
+        StudentProfileDetail.objects.bulk_create([detail for detail in details if detail._state.adding],
+                                                 batch_size=self.batch_size)
+        if existing:
+            StudentProfileDetail.objects.bulk_update(existing, PROFILE_DETAIL_FIELDS, batch_size=self.batch_size)
+        for student in students:
+            student._detail_changed = False
+
+    def _save_one_by_one(self, entries, create):
+        """Save entries individually; return ``{row_number: error}`` for the ones that failed."""
+        failed = {}
+        for entry in entries:
+            entry['student']._keep_import_hash = True
+            try:
+                with transaction.atomic():
+                    entry['student'].save(force_insert=create)
+            except Exception as e:
+                failed[entry['row']] = e
+        return failed
+
+
+class DryRunStudentImporter(BulkStudentImporter):
+    """
+    Run the bulk importer's lookups and uniqueness checks without writing.
+
+    Existing users and student keys are read once by ``prefetch()``; rows
+    that would update a student work on a stub that only carries its
+    passport and NIK, so no student rows are loaded per chunk. New users get
+    negative placeholder ids, which lets later rows find them exactly as
+    they would after a real write. The counters project what ``--bulk``
+    would do.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.student_keys = {}
+        self.stubs = {}
+        self.placeholder_ids = itertools.count(-1, -1)
+        username_field = self.User._meta.get_field('username')
+        email_field = self.User._meta.get_field('email')
+        self.user_limits = (('username', username_field.max_length), ('email', email_field.max_length))
+
+    def _index_keys(self, pk, passport_number, nik):
+        super()._index_keys(pk, passport_number, nik)
+        self.student_keys[pk] = (passport_number, nik)
+
+    def load_students(self, pks):
+        return {}
+
+    def get_student(self, pk):
+        student = self.pending_students.get(pk) or self.stubs.get(pk)
+        if student is None:
+            passport_number, nik = self.student_keys.get(pk, (None, None))
+            student = self.stubs[pk] = Student(pk=pk, passport_number=passport_number, nik=nik)
+        return student
+
+    def flush(self, staged):
+        """Count what ``write_users``/``write_students`` would do."""
+        new_users = {}
+        for entry in staged:
+            if entry['user_created']:
+                new_users.setdefault(id(entry['user']), entry['user'])
+        failed = {}
+        for key, user in new_users.items():
+            issues = [(field, f'longer than {limit} characters') for field, limit in self.user_limits
+                      if len(getattr(user, field) or '') > limit]
+            if issues:
+                failed[key] = issues
+                self._drop_failed_user(user)
+            else:
+                user.pk = next(self.placeholder_ids)
+                self.created_users += 1
+        for entry in staged:
+            issues = failed.get(id(entry['user'])) if entry['user_created'] else None
+            if issues:
+                self._discard_student(entry)
+                if not entry['rejected']:
+                    self.error(entry['row'], f'user create error: {issues[0][0]} {issues[0][1]}', entry['values'],
+                               issues)
+        self.updated_users += len({entry['user'].pk for entry in staged if entry['user_updated']})
+
+        for entry in staged:
+            action = entry['student_action']
+            if action == 'create':
+                entry['student'].user = entry['user']
+                self.students_by_user[entry['user'].pk] = entry['student'].pk
+                self.created_students += 1
+            elif action == 'update':
+                self.updated_students += 1
+            if action:
+                entry['message'] = self.style.SUCCESS(
+                    f"Row {entry['row']}: Would {action} student for user {entry['user'].username}")
+            message = entry.get('message')
+            if message:
+                self.say(message)
@@ -0,0 +1,155 @@
+"""
+Search, filter and sort rules of the staff student list.
+
+``StaffDashboardDataListView`` and the student exports both build their
+querysets here, so a download always holds the rows the list shows.
+
+The search box understands field clauses, each turned into an exact or
+prefix lookup on an indexed column instead of the broad search:
+
+    nik:1371021310040003      exact with 16 digits, otherwise a prefix
+    passport:E3555146         prefix, case-insensitive
+    email:foo@                the whole address, or a prefix of it
+    faculty:"Lughah Arabiyyah"  prefix, case-insensitive
+    degree:S2                 degree code (or label)
+
+Bare 16-digit numbers are taken as a NIK and bare email addresses as an
+email. Whatever is left is free text for ``student_search``.
+"""
+import re
+import shlex
+
+from django.db.models import Q
+
+from data_management.models import Student
+from data_management.utils.student_search import search_identifiers, search_students
+
+CHOICE_FILTERS = ('gender', 'degree_level', 'level', 'marital_status')
+FILTER_PARAMS = ('q', 'match', *CHOICE_FILTERS)
+# lower-cased copies of the user's name and email are stored on the student (indexed, no join)
+SORT_FIELDS = ['full_name_key', 'email_key', 'degree_level', 'semester_level', 'faculty', 'major', 'level']
+DEFAULT_ORDERING = 'full_name_key'
+# sorts that need no name tie-breaker (emails barely tie; the primary key settles the rest)
+UNTIED_SORTS = {DEFAULT_ORDERING, 'email_key'}
+# sort values of links and bookmarks from before the keys existed
+LEGACY_SORTS = {'user__first_name': 'full_name_key', 'user__email': 'email_key'}
+
+NIK = re.compile(r'\d{16}')
+EMAIL = re.compile(r'[^@\s]+@[^@\s]+\.[^@\s]+')
+DEGREES = {key.lower(): key for key, label in Student.DEGREE_LEVEL_CHOICES}
+DEGREES.update({label.lower(): key for key, label in Student.DEGREE_LEVEL_CHOICES})
+
+
+def nik_clause(value):
+    return Q(nik=value) if NIK.fullmatch(value) else Q(nik__startswith=value)
+
+
+def passport_clause(value):
+    return Q(passport_number__istartswith=value)
+
+
+def email_clause(value):
+    return Q(user__email__iexact=value) if EMAIL.fullmatch(value) else Q(user__email__istartswith=value)
+
+
+def faculty_clause(value):
+    return Q(faculty__istartswith=value)
+
+
+def degree_clause(value):
+    degree = DEGREES.get(value.lower())
+    return Q(degree_level=degree) if degree else Q(pk__in=[])
+
+
+SEARCH_FIELDS = {
+    'nik': nik_clause,
+    'passport': passport_clause,
+    'email': email_clause,
+    'faculty': faculty_clause,
+    'degree': degree_clause,
+}
+
+
+def parse_search(q):
+    """Split the search box text into field clauses (``Q`` objects) and the remaining free text."""
+    try:
+        tokens = shlex.split(q)
+    except ValueError:  # unbalanced quotes
+        tokens = q.split()
+    clauses, words = [], []
+    for token in tokens:
+        name, colon, value = token.partition(':')
+        if colon and name.lower() in SEARCH_FIELDS:
+            if value.strip():
+                clauses.append(SEARCH_FIELDS[name.lower()](value.strip()))
+        elif NIK.fullmatch(token):
+            clauses.append(nik_clause(token))
+        elif EMAIL.fullmatch(token):
+            clauses.append(email_clause(token))
+        else:
+            words.append(token)
+    return clauses, ' '.join(words)
+
+
+def choice_filter(params, skip=None):
+    """Q for the exact ``CHOICE_FILTERS`` set in ``params``, leaving out ``skip``."""
+    selected = Q()
+    for field in CHOICE_FILTERS:
+        value = params.get(field, '').strip()
+        if value and field != skip:
+            selected &= Q(**{field: value})
+    return selected
+
+
+def search_only(params):
+    """``params`` without the choice filters (the search box alone)."""
+    return {name: params.get(name) for name in ('q', 'match') if params.get(name)}
+
+
+def filter_students(qs, params):
+    """Apply the search box (``q``/``match``, see ``student_search``) and the exact filters from ``params``."""
+    clauses, q = parse_search(params.get('q', ''))
+    for clause in clauses:
+        qs = qs.filter(clause)
+    if q:
+        if params.get('match') == 'id':
+            qs = search_identifiers(qs, q)
+        else:
+            qs = search_students(qs, q)
+        if 'search_rank' in qs.query.annotations:
+            # best matches first; an explicit ``sort`` (``sort_students``) still wins
+            qs = qs.order_by('-search_rank', *qs.query.order_by)
+    return qs.filter(choice_filter(params))
+
+
+def sort_students(qs, params, allowed=SORT_FIELDS):
+    """Order by ``sort``/``dir`` from ``params`` when ``sort`` is an allowed field.
+
+    Ties are broken by name in the same direction, which the ``(field, full_name_key, id)``
+    indexes on Student serve in either direction (name and email have ``(field, id)``).
+    """
+    sort = sort_field(params)
+    if sort in allowed:
+        direction = '-' if params.get('dir', 'asc') == 'desc' else ''
+        ordering = [sort] if sort in UNTIED_SORTS else [sort, DEFAULT_ORDERING]
+        qs = qs.order_by(*[f'{direction}{field}' for field in ordering])
+    return qs
+
+
+def sort_field(params):
+    """The ``sort`` of ``params``, with the legacy names mapped to the current ones."""
+    sort = params.get('sort', '').strip()
+    return LEGACY_SORTS.get(sort, sort)
+
+
+def sort_query(params, allowed=SORT_FIELDS):
+    """The active ``sort``/``dir`` of ``params`` as a dict, for links that keep the order."""
+    sort = sort_field(params)
+    if sort not in allowed:
+        return {}
+    return {'sort': sort, 'dir': 'desc' if params.get('dir') == 'desc' else 'asc'}
+
+
+def filter_query(params):
+    """The active filters of ``params`` as a dict, for building links that keep them."""
+    return {name: params.get(name) for name in FILTER_PARAMS if params.get(name)}
@@ -0,0 +1,127 @@
+"""
+Full-text search over students for the staff list (``q=``).
+
+The search document holds the user's name and email, the passport
+number and NIK, and the faculty and major. The database maintains it
+with triggers (migration ``0024_student_search``), so every write path
+keeps it current, including the bulk and COPY imports:
+
+- PostgreSQL: ``data_management_student.search_document``, a weighted
+  ``tsvector`` (name and identity numbers A, email B, study C) with a
+  GIN index, ranked with ``ts_rank``.
+- SQLite (local development): the FTS5 table
+  ``data_management_student_search``, ranked with ``bm25``.
+
+Every word of the query must match the start of a word in the document,
+so ``ahm put`` finds "Ahmad Putra" and ``3201`` finds a NIK starting with
+those digits. Other databases fall back to ``icontains`` matching.
+
+``match=id`` switches to identifier lookup: the query (spaces removed)
+is matched anywhere inside the passport number, NIK, LAPDIK number or
+WhatsApp number, or by trigram similarity to tolerate a typo, and ranked
+by similarity. On PostgreSQL with ``pg_trgm`` (migration
+``0025_identifier_trigram``) GIN trigram indexes serve both; elsewhere
+it is a plain ``icontains`` scan without ranking.
+
+Ranks are double precision (PostgreSQL computes them as ``real``) so
+that a rank read back from a keyset cursor compares equal to the row it
+came from.
+
+SQLite drops triggers with their table, and cannot rebuild it while the
+trigger on ``auth_user`` refers to it, so a migration that makes Django
+rebuild ``data_management_student`` there drops the search triggers
+first and recreates them afterwards (see ``0028_student_sort_keys``).
+"""
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, F, FloatField, Func, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast, Greatest
+
+STUDENT_TABLE = 'data_management_student'
+FTS_TABLE = 'data_management_student_search'
+# characters kept inside a search term; PostgreSQL's parser treats "a@b.c" and "x-y" as words
+PG_TERM = re.compile(r'[\w@.+-]+')
+FTS_TERM = re.compile(r'\w+')
+# bm25 weights of (student_id, name, email, identity, study), in line with the PostgreSQL weights
+FTS_WEIGHTS = '0, 10, 4, 10, 1'
+IDENTIFIER_FIELDS = ['passport_number', 'nik', 'lapdik_number', 'whatsapp_number']
+
+_has_trigram = {}
+
+
+def has_trigram():
+    """Whether ``pg_trgm`` is installed in the (PostgreSQL) default database; checked once per process."""
+    name = connection.settings_dict['NAME']
+    if name not in _has_trigram:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _has_trigram[name] = cursor.fetchone() is not None
+    return _has_trigram[name]
+
+
+def pg_query(q):
+    """``q`` as a ``to_tsquery`` expression: every term as a quoted prefix, AND-ed."""
+    terms = [term.strip('.+-') for term in PG_TERM.findall(q.lower())]
+    return ' & '.join(f"'{term}':*" for term in terms if term)
+
+
+def fts_query(q):
+    """``q`` as an FTS5 query: every term as a quoted prefix, AND-ed."""
+    return ' '.join(f'"{term}"*' for term in FTS_TERM.findall(q.lower()))
+
+
+def contains_filter(q):
+    return (Q(user__first_name__icontains=q) | Q(user__last_name__icontains=q) | Q(user__email__icontains=q) |
+            Q(passport_number__icontains=q) | Q(nik__icontains=q) | Q(faculty__icontains=q) |
+            Q(major__icontains=q))
+
+
+def search_students(qs, q):
+    """Students of ``qs`` matching ``q``, annotated with ``search_rank`` (higher is better)."""
+    if connection.vendor == 'postgresql':
+        query = pg_query(q)
+        if not query:
+            return qs.none()
+        return qs.filter(RawSQL(
+            f"{STUDENT_TABLE}.search_document @@ to_tsquery('simple', %s)", [query], output_field=BooleanField(),
+        )).annotate(search_rank=RawSQL(
+            f"ts_rank({STUDENT_TABLE}.search_document, to_tsquery('simple', %s))::float8", [query], output_field=FloatField(),
+        ))
+    if connection.vendor == 'sqlite':
+        query = fts_query(q)
+        if not query:
+            return qs.none()
+        return qs.filter(
+            pk__in=RawSQL(f'SELECT student_id FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [query]),
+        ).annotate(search_rank=RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, {FTS_WEIGHTS}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.student_id = {STUDENT_TABLE}.id',
+            [query], output_field=FloatField(),
+        ))
+    return qs.filter(contains_filter(q))
+
+
+def like_pattern(value):
+    escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def search_identifiers(qs, q):
+    """Students of ``qs`` with ``q`` inside (or similar to) one of ``IDENTIFIER_FIELDS``, best match first."""
+    q = ''.join(q.split())
+    if not q:
+        return qs.none()
+    if connection.vendor == 'postgresql' and has_trigram():
+        conditions = ' OR '.join(
+            f'{STUDENT_TABLE}.{field} ILIKE %s OR {STUDENT_TABLE}.{field} %% %s' for field in IDENTIFIER_FIELDS)
+        return qs.filter(RawSQL(
+            f'({conditions})', [like_pattern(q), q] * len(IDENTIFIER_FIELDS), output_field=BooleanField(),
+        )).annotate(search_rank=Cast(Greatest(*[
+            Func(F(field), Value(q), function='similarity', output_field=FloatField()) for field in IDENTIFIER_FIELDS
+        ]), FloatField()))
+    match = Q()
+    for field in IDENTIFIER_FIELDS:
+        match |= Q(**{f'{field}__icontains': q})
+    return qs.filter(match)
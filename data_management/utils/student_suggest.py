@@ -0,0 +1,82 @@
+"""
+Typeahead suggestions for the staff list search box.
+
+Each worker keeps a prefix index of the students in memory: one sorted
+list of normalized keys (first name, last name, full name, email local
+part, passport number and NIK), searched with ``bisect`` for the range
+of keys starting with the typed text. A lookup is a binary search plus a
+short scan, so it needs no query beyond the data version check.
+
+The index belongs to a data version (see ``data_version``) and is
+rebuilt, with one query, on the first lookup after the data changed.
+"""
+import bisect
+import threading
+import unicodedata
+from collections import namedtuple
+
+from data_management.models import Student
+from data_management.utils.data_version import current_version
+
+LIMIT = 8
+
+Suggestion = namedtuple('Suggestion', 'pk name email passport_number nik')
+
+
+def normalize(value):
+    """Case-folded ``value`` without accents and with single spaces."""
+    value = value or ''
+    if not value.isascii():
+        value = ''.join(char for char in unicodedata.normalize('NFKD', value) if not unicodedata.combining(char))
+    return ' '.join(value.casefold().split())
+
+
+class PrefixIndex:
+    def __init__(self, rows):
+        self.students = []
+        entries = set()
+        for pk, first_name, last_name, email, passport_number, nik in rows:
+            position = len(self.students)
+            self.students.append(Suggestion(pk, f'{first_name} {last_name}'.strip(), email, passport_number, nik))
+            first_name, last_name = normalize(first_name), normalize(last_name)
+            keys = {first_name, last_name, f'{first_name} {last_name}'.strip(),
+                    normalize(email.split('@')[0]), normalize(passport_number), normalize(nik)}
+            keys.update(first_name.split())
+            keys.update(last_name.split())
+            entries.update((key, position) for key in keys if key)
+        entries = sorted(entries)
+        self.keys = [key for key, position in entries]
+        self.positions = [position for key, position in entries]
+
+    def search(self, q, limit=LIMIT):
+        """Students with a key starting with ``q``, at most ``limit``; a key equal to ``q`` sorts first."""
+        prefix = normalize(q)
+        if not prefix:
+            return []
+        found = []
+        for index in range(bisect.bisect_left(self.keys, prefix), len(self.keys)):
+            if not self.keys[index].startswith(prefix) or len(found) == limit:
+                break
+            if self.positions[index] not in found:
+                found.append(self.positions[index])
+        return [self.students[position] for position in found]
+
+
+_index = (None, None)  # (data version, PrefixIndex), replaced as a whole
+_lock = threading.Lock()
+
+
+def student_index():
+    global _index
+    version = current_version()
+    if _index[0] != version:
+        with _lock:
+            if _index[0] != version:
+                rows = Student.objects.values_list(
+                    'pk', 'user__first_name', 'user__last_name', 'user__email', 'passport_number', 'nik')
+                _index = (version, PrefixIndex(rows.iterator(chunk_size=2000)))
+    return _index[1]
+
+
+def suggest(q, limit=LIMIT):
+    return student_index().search(q, limit)
@@ -1,5 +1,5 @@
-import csv
 import logging
+import os
 import secrets
 
 from django.conf import settings
@@ -11,17 +11,32 @@ from django.contrib.auth.forms import PasswordResetForm
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.mail import send_mail
 from django.db import transaction
-from django.http import Http404, HttpResponse
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse,
+)
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse_lazy
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
 from django.utils.crypto import get_random_string
-from django.utils.http import urlencode
+from django.utils.http import http_date, urlencode
 from django.utils.text import slugify
 from django.views.generic import DetailView, UpdateView, ListView, CreateView, DeleteView
 
 from .forms import UserRegistrationForm, UserLoginForm, StudentForm, StaffStudentForm, StaffStudentCreateForm
-from .models import Student
+from .models import ExportJob, Student
+from .utils.data_version import current_version, version_tag
+from .utils.export_cache import caching, cached_export_name, export_etag, open_cached_export
+from .utils.export_jobs import enqueue_export, resume_if_abandoned
 from .utils.logging_utils import security_logger, audit_logger, get_user_info, log_user_action
+from .utils.export_formats import FORMATS, available_formats
+from .utils.student_columns import LIST_FIELDS, check_projected
+from .utils.student_counts import Count, count_students, facet_counts, total_students
+from .utils.student_export import COLUMN_SETS, export_rows
+from .utils.student_suggest import suggest
+from .utils.keyset import keyset_page
+from .utils.student_query import (
+    DEFAULT_ORDERING, SORT_FIELDS, filter_query, filter_students, sort_field, sort_query, sort_students,
+)
 
 # Configure logger with proper naming convention
 logger = logging.getLogger(__name__)
@@ -65,7 +80,7 @@ class StudentDataDetailView(LoginRequiredMixin, DetailView):
                 logger.info("Student data detail skipped for staff user=%s", user.username)
                 return None
             logger.info(f"Student data detail requested - User: {user.username}")
-            student_data = self.model.objects.get(user=user)
+            student_data = self.model.objects.select_related('profile_detail').get(user=user)
             logger.info(f"Student data retrieved successfully - User: {user.username}")
             return student_data
         except self.model.DoesNotExist:
@@ -101,7 +116,7 @@ class StudentDataUpdateView(LoginRequiredMixin, UpdateView):
         """Get student object for update."""
         try:
             logger.info(f"Student data update requested - User: {self.request.user.username}")
-            return get_object_or_404(self.model, user=self.request.user)
+            return get_object_or_404(self.model.objects.select_related('profile_detail'), user=self.request.user)
         except Exception as e:
             logger.error(
                 f"Error getting student object for update - User: {self.request.user.username}, Error: {str(e)}",
@@ -376,9 +391,13 @@ class StaffDashboardDataListView(LoginRequiredMixin, ListView):
     template_name = 'dashboard/staff/staff_dashboard_list.html'
     context_object_name = 'students'
     paginate_by = 10
-    ordering = ['user__first_name']
-    allowed_sort_fields = ['user__first_name', 'user__email', 'degree_level', 'semester_level', 'faculty', 'major',
-                           'level']
+    ordering = [DEFAULT_ORDERING]
+    allowed_sort_fields = SORT_FIELDS
+    # htmx requests get just the fragment they swap, chosen by the target element (HX-Target)
+    partial_templates = {
+        'student-list': 'dashboard/staff/partials/student_list.html',
+        'load-more': 'dashboard/staff/partials/student_rows.html',
+    }
 
     def dispatch(self, request, *args, **kwargs):
         # Permission check
@@ -398,67 +417,77 @@ class StaffDashboardDataListView(LoginRequiredMixin, ListView):
         return super().dispatch(request, *args, **kwargs)
 
     def get_queryset(self):
-        qs = super().get_queryset().select_related('user')
-        q = self.request.GET.get('q', '').strip()
-        gender = self.request.GET.get('gender', '').strip()
-        degree_level = self.request.GET.get('degree_level', '').strip()
-        level = self.request.GET.get('level', '').strip()
-        marital_status = self.request.GET.get('marital_status', '').strip()
-        sort = self.request.GET.get('sort', '').strip()
-        direction = self.request.GET.get('dir', 'asc')
-
-        from django.db.models import Q
-        if q:
-            qs = qs.filter(
-                Q(user__first_name__icontains=q) |
-                Q(user__last_name__icontains=q) |
-                Q(user__email__icontains=q) |
-                Q(passport_number__icontains=q) |
-                Q(nik__icontains=q) |
-                Q(faculty__icontains=q) |
-                Q(major__icontains=q)
-            )
-        if gender:
-            qs = qs.filter(gender=gender)
-        if degree_level:
-            qs = qs.filter(degree_level=degree_level)
-        if level:
-            qs = qs.filter(level=level)
-        if marital_status:
-            qs = qs.filter(marital_status=marital_status)
-        if sort in self.allowed_sort_fields:
-            ordering = f"{'-' if direction == 'desc' else ''}{sort}"
-            qs = qs.order_by(ordering)
-        return qs
+        # only the columns the rows render; the wide text fields stay on the detail page
+        qs = filter_students(super().get_queryset().select_related('user').only(*LIST_FIELDS), self.request.GET)
+        return sort_students(qs, self.request.GET, self.allowed_sort_fields)
+
+    def paginate_queryset(self, queryset, page_size):
+        """Keyset pages (``cursor=``) by default; numbered OFFSET pages only when ``page=`` is given."""
+        check_projected(queryset, 'Staff student list')
+        if self.page_kwarg in self.request.GET:
+            return super().paginate_queryset(queryset, page_size)
+        page = keyset_page(queryset, page_size, self.request.GET.get('cursor'))
+        return None, page, page.object_list, page.has_next or page.has_previous
+
+    def get_paginator(self, queryset, per_page, **kwargs):
+        paginator = super().get_paginator(queryset, per_page, **kwargs)
+        # page numbers need the exact count; take it from the cache when this filter was counted before
+        paginator.count = count_students(queryset, self.request.GET, estimate=False).value
+        return paginator
+
+    def partial_template(self):
+        return self.partial_templates.get(self.request.htmx.target) if self.request.htmx else None
+
+    def get_template_names(self):
+        return [self.partial_template()] if self.partial_template() else super().get_template_names()
+
+    def render_to_response(self, context, **response_kwargs):
+        response = super().render_to_response(context, **response_kwargs)
+        # the same URL answers with a page or a fragment
+        patch_vary_headers(response, ['HX-Request', 'HX-Target'])
+        return response
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
         ctx['query'] = self.request.GET.get('q', '')
+        ctx['selected_match'] = self.request.GET.get('match', '')
         ctx['selected_gender'] = self.request.GET.get('gender', '')
         ctx['selected_degree_level'] = self.request.GET.get('degree_level', '')
         ctx['selected_level'] = self.request.GET.get('level', '')
         ctx['selected_marital_status'] = self.request.GET.get('marital_status', '')
-        ctx['gender_choices'] = Student.GENDER_CHOICES
-        ctx['degree_choices'] = Student.DEGREE_LEVEL_CHOICES
-        ctx['level_choices'] = Student.LEVEL_CHOICES
-        ctx['marital_choices'] = Student.MARITAL_STATUS_CHOICES
-        ctx['current_sort'] = self.request.GET.get('sort', '')
+        ctx['current_sort'] = sort_field(self.request.GET)
         ctx['current_dir'] = self.request.GET.get('dir', 'asc')
-        filter_params = {}
-        for p in ['q', 'gender', 'degree_level', 'level', 'marital_status']:
-            val = self.request.GET.get(p)
-            if val:
-                filter_params[p] = val
-        ctx['base_filter_query'] = urlencode(filter_params)
-        # Stats
-        ctx['total_students'] = Student.objects.count()
-        ctx['filtered_students'] = ctx['paginator'].count if 'paginator' in ctx else ctx['total_students']
-        ctx['is_filtered'] = ctx['filtered_students'] != ctx['total_students']
+        ctx['base_filter_query'] = urlencode(filter_query(self.request.GET))
+        ctx['list_query'] = urlencode({**filter_query(self.request.GET), **sort_query(self.request.GET)})
+        # row fragments are cached under the data version
+        ctx['data_version'] = version_tag(current_version())
+        # the filter form also refreshes the header and the option counts (out-of-band swaps)
+        ctx['refresh_filters'] = bool(self.request.htmx) and self.request.htmx.trigger == 'student-filters'
+        if self.partial_template() and not ctx['refresh_filters']:
+            return ctx
+        # (value, label, count) per option, from one aggregate query
+        facets = facet_counts(self.request.GET)
+        ctx['gender_choices'] = facets['gender']
+        ctx['degree_choices'] = facets['degree_level']
+        ctx['level_choices'] = facets['level']
+        ctx['marital_choices'] = facets['marital_status']
+        ctx['export_formats'] = [name for name in available_formats() if name != 'csv']
+        # Stats: the total is a maintained counter, filtered counts are cached or estimated
+        ctx['total_students'] = total_students()
+        ctx['is_filtered'] = bool(filter_query(self.request.GET))
+        if ctx['is_filtered']:
+            count = count_students(self.object_list, self.request.GET)
+        else:
+            count = Count(ctx['total_students'], False)
+        ctx['filtered_students'] = count.value
+        ctx['filtered_approximate'] = count.approximate
         return ctx
 
 
 class StaffStudentDetailView(LoginRequiredMixin, DetailView):
     model = Student
+    # detail and edit pages read the health, interest and organization fields (StudentProfileDetail)
+    queryset = Student.objects.select_related('user', 'profile_detail')
     template_name = 'dashboard/staff/staff_student_detail.html'
     context_object_name = 'student'
 
@@ -486,6 +515,7 @@ class StaffStudentDetailView(LoginRequiredMixin, DetailView):
 
 class StaffStudentUpdateView(LoginRequiredMixin, UpdateView):
     model = Student
+    queryset = Student.objects.select_related('user', 'profile_detail')
     form_class = StaffStudentForm
     template_name = 'dashboard/staff/staff_student_form.html'
     context_object_name = 'student'
@@ -780,55 +810,81 @@ class StaffStudentCreateView(LoginRequiredMixin, CreateView):
         return url
 
 
-def export_students_csv(request):
+def require_export_staff(request):
     if not request.user.is_authenticated or not request.user.groups.filter(name="data_management_staff").exists():
         raise Http404()
-    # replicate filtering logic
-    qs = Student.objects.all()
-    q = request.GET.get('q', '').strip()
-    gender = request.GET.get('gender', '').strip()
-    degree_level = request.GET.get('degree_level', '').strip()
-    level = request.GET.get('level', '').strip()
-    marital_status = request.GET.get('marital_status', '').strip()
-
-    from django.db.models import Q
-    if q:
-        qs = qs.filter(
-            Q(full_name__icontains=q) |
-            Q(email__icontains=q) |
-            Q(passport_number__icontains=q) |
-            Q(nik__icontains=q) |
-            Q(faculty__icontains=q) |
-            Q(major__icontains=q)
-        )
-    if gender:
-        qs = qs.filter(gender=gender)
-    if degree_level:
-        qs = qs.filter(degree_level=degree_level)
-    if level:
-        qs = qs.filter(level=level)
-    if marital_status:
-        qs = qs.filter(marital_status=marital_status)
-
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="students.csv"'
-    writer = csv.writer(response)
-    writer.writerow(['Full Name', 'Email', 'Passport', 'NIK', 'Degree', 'Semester', 'Faculty', 'Major', 'Level'])
-    for s in qs.iterator():
-        writer.writerow([
-            s.full_name,
-            s.email,
-            s.passport_number or '',
-            s.nik or '',
-            s.degree_level,
-            s.semester_level,
-            s.faculty,
-            s.major,
-            s.get_level_display(),
-        ])
+
+
+def export_students(request):
+    """Stream the listed students as ``format`` (csv, xlsx, ndjson, parquet, arrow) with ``columns`` (summary, all).
+
+    Served from ``export_cache`` (or as a 304) while the student data version is unchanged.
+    """
+    require_export_staff(request)
+    format_name = request.GET.get('format', 'csv')
+    columns_name = request.GET.get('columns', 'summary')
+    if format_name not in available_formats() or columns_name not in COLUMN_SETS:
+        return HttpResponseBadRequest(f"Unsupported export; formats: {', '.join(available_formats())}, "
+                                      f"columns: {', '.join(COLUMN_SETS)}")
+    export_format = FORMATS[format_name]
+    columns = COLUMN_SETS[columns_name]
+    version = current_version()
+    etag = export_etag(request.GET, columns_name, format_name, version)
+    last_modified = int(version.changed_at.timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        name = cached_export_name(request.GET, columns_name, format_name, export_format.extension, version)
+        cached = open_cached_export(name)
+        if cached is not None:
+            response = FileResponse(cached, content_type=export_format.content_type)
+        else:
+            # same rows and order as the staff list; one query, streamed in chunks
+            qs = filter_students(Student.objects.order_by(DEFAULT_ORDERING), request.GET)
+            qs = sort_students(qs, request.GET)
+            chunks = export_format.writer(export_rows(qs, columns), columns)
+            response = StreamingHttpResponse(caching(chunks, name, version), content_type=export_format.content_type)
+        filename = 'students' if columns_name == 'summary' else f'students-{columns_name}'
+        response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format.extension}"'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
     return response
 
 
+def export_job_create(request):
+    """Start (or reuse) a background export of every column for the current filters."""
+    require_export_staff(request)
+    if request.method != 'POST':
+        raise Http404()
+    job = enqueue_export(request.GET, columns='all', user=request.user)
+    return render(request, 'dashboard/staff/partials/export_job.html', {'job': job})
+
+
+def export_job_status(request, pk):
+    require_export_staff(request)
+    job = get_object_or_404(ExportJob, pk=pk)
+    if resume_if_abandoned(job):
+        job.refresh_from_db()
+    return render(request, 'dashboard/staff/partials/export_job.html', {'job': job})
+
+
+def export_job_download(request, pk):
+    require_export_staff(request)
+    job = get_object_or_404(ExportJob, pk=pk, status=ExportJob.DONE)
+    security_logger.log_access_attempt(request=request, resource=f"Student Export {job.pk}", granted=True)
+    return FileResponse(job.file.open('rb'), as_attachment=True, filename=os.path.basename(job.file.name))
+
+
+def student_suggest(request):
+    """Typeahead for the staff list search box: students whose names or identifiers start with ``q``."""
+    if not request.user.is_authenticated or not request.user.is_staff:
+        raise Http404()
+    suggestions = suggest(request.GET.get('q', ''))
+    if request.htmx:
+        return render(request, 'dashboard/staff/partials/student_suggestions.html', {'suggestions': suggestions})
+    return JsonResponse({'results': [suggestion._asdict() for suggestion in suggestions]})
+
+
 # Password reset for a student (staff action)
 @login_required
 def staff_student_reset_password(request, pk):
@@ -46,7 +46,7 @@ fi
 
 # Create required directories
 echo "📁 Creating required directories..."
-mkdir -p logs backups nginx/ssl media
+mkdir -p logs backups nginx/ssl media exports
 
 # Set permissions
 echo "🔒 Setting permissions..."
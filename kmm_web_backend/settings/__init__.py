@@ -10,3 +10,7 @@ if env == 'production':
     from .production import *
 else:
     from .local import *
+
+# the environment these settings were loaded for; base.py's load_dotenv() may
+# change DJANGO_ENV afterwards, so worker processes are given this value
+DJANGO_ENV = env
@@ -98,6 +98,9 @@ DATABASES['default']['NAME'] = BASE_DIR / 'db.sqlite3'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_ROOT = BASE_DIR / 'media'
 STORAGES["default"]["OPTIONS"]["location"] = MEDIA_ROOT
+# Tidak boleh di bawah MEDIA_ROOT: nginx menyajikan /media/ tanpa login
+EXPORTS_ROOT = BASE_DIR / 'exports'
+STORAGES["exports"]["OPTIONS"]["location"] = EXPORTS_ROOT
 
 # Set logging file paths
 LOGGING['handlers']['file']['filename'] = BASE_DIR / 'logs' / 'django.log'
@@ -18,6 +18,13 @@ STORAGES = {
             "location": None,  # Akan diset ke MEDIA_ROOT
         }
     },
+    # Student exports (passport, NIK, health data) - di luar MEDIA_ROOT, hanya lewat view export
+    "exports": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+        "OPTIONS": {
+            "location": None,  # Akan diset ke EXPORTS_ROOT
+        }
+    },
     "staticfiles": {
         "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
     }